@@ -27,14 +27,25 @@ import os
 sys.path.insert(
     0, os.path.join(os.path.abspath(os.path.dirname(__file__)), '..'))
 
-from crutch.core.driver import Driver
-from crutch.core.runner import RunnerDefault, Runners
-
-from crutch.cpp.runner import RunnerCpp
+import crutch.core.daemon as Daemon
 
 def create_driver(argv=None):
+  # Imported here so the daemon client does not pay for them
+  from crutch.core.driver import Driver
+  from crutch.core.runner import RunnerDefault, Runners
+  from crutch.cpp.runner import RunnerCpp
   return Driver(Runners({'new': RunnerDefault, 'cpp': RunnerCpp}), argv)
 
 def main(): #pragma: no cover
-  code = create_driver(sys.argv[1:]).run()
+  argv = sys.argv[1:]
+
+  if argv and argv[0] == '--daemon':
+    sys.exit(Daemon.Daemon(create_driver).serve())
+
+  if os.environ.get(Daemon.ENV_DAEMON):
+    code = Daemon.forward(argv)
+    if code is not None:
+      sys.exit(code)
+
+  code = create_driver(argv).run()
   sys.exit(code)
@@ -0,0 +1,110 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017 Artyom Goncharov
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
+# OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Templates packed into a single zip archive. Members are stored uncompressed,
+and an index member lists every template with its digest, so templates can be
+looked up without touching the filesystem.
+
+This module must only depend on the standard library, setup.py loads it to
+pack templates at build time.
+"""
+
+import threading
+import tempfile
+import hashlib
+import zipfile
+import shutil
+import json
+import os
+
+
+INDEX = '.index.json'
+
+
+def pack(src_dir, filename):
+  """
+  Pack every non-hidden file under `src_dir` into `filename` bundle
+
+  :returns: `list` of packed template names
+  """
+  names = list()
+  for root, dirs, files in os.walk(src_dir):
+    dirs[:] = sorted(d for d in dirs if not d.startswith('.'))
+    for name in sorted(files):
+      if name.startswith('.'):
+        continue
+      path = os.path.relpath(os.path.join(root, name), src_dir)
+      names.append(path.replace(os.sep, '/'))
+
+  folder = os.path.dirname(os.path.abspath(filename))
+  handle, tmp = tempfile.mkstemp(dir=folder, suffix='.zip')
+  os.close(handle)
+
+  try:
+    digests = dict()
+    with zipfile.ZipFile(tmp, 'w', zipfile.ZIP_STORED) as archive:
+      for name in names:
+        with open(os.path.join(src_dir, *name.split('/')), 'rb') as fin:
+          content = fin.read()
+        digests[name] = hashlib.sha1(content).hexdigest()
+        archive.writestr(name, content)
+      archive.writestr(
+          INDEX, json.dumps({'names': names, 'digests': digests}, sort_keys=True))
+    os.rename(tmp, filename)
+  except:
+    os.remove(tmp)
+    raise
+
+  return names
+
+
+class TemplateBundle(object):
+  """
+  Read-only view of a packed bundle. The archive is opened once, reads are
+  serialized since a zip file object is not thread safe.
+  """
+
+  def __init__(self, filename):
+    self.filename = filename
+    self.archive = zipfile.ZipFile(filename)
+    self.lock = threading.Lock()
+
+    index = json.loads(self.archive.read(INDEX))
+    self.names = index['names']
+    self.digests = index['digests']
+
+  def __contains__(self, name):
+    return name in self.digests
+
+  def read(self, name):
+    with self.lock:
+      return self.archive.read(name)
+
+  def extract(self, name, filename):
+    """
+    Stream a member into `filename`
+    """
+    with self.lock:
+      with self.archive.open(name) as fsrc:
+        with open(filename, 'wb') as fdst:
+          shutil.copyfileobj(fsrc, fdst, 1024 * 1024)
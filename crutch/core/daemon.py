@@ -0,0 +1,371 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017 Artyom Goncharov
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
+# OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Opt-in CRUTCH daemon. It keeps an activated runtime per project directory and
+executes commands forwarded by thin clients over a Unix domain socket, so a
+repeated command skips imports, config loading and feature activation.
+
+Start it with `crutch --daemon`, clients use it if CRUTCH_DAEMON environment
+variable is set and fall back to a regular run if nobody listens.
+
+This module is imported by the client, so it must stay light: the driver is
+imported only by the server.
+
+Protocol: client sends a single JSON line {"argv": [...], "cwd": "..."}, the
+server replies with frames of one kind byte and a 4-byte length followed by
+the payload. FRAME_OUTPUT carries raw output, FRAME_EXIT carries exit code and
+ends the exchange. FRAME_LOCAL ends it without running anything, the command
+needs a terminal and must be run by the client.
+"""
+
+from __future__ import print_function
+
+import SocketServer
+import threading
+import tempfile
+import socket
+import struct
+import errno
+import json
+import sys
+import os
+
+ENV_DAEMON = 'CRUTCH_DAEMON'
+ENV_SOCKET = 'CRUTCH_DAEMON_SOCKET'
+
+FRAME_OUTPUT = b'o'
+FRAME_EXIT = b'x'
+FRAME_LOCAL = b'l'
+FRAME_HEADER = struct.Struct('!cI')
+
+# Commands that create projects, change features or need a terminal always
+# run in the client process. Interactive actions are refused by the daemon.
+LOCAL_COMMANDS = frozenset(['new', 'feature', '-p', '--prompt', '--daemon'])
+
+
+def is_local(argv):
+  return bool(argv) and argv[0] in LOCAL_COMMANDS
+
+
+def is_private(path, directory=False):
+  """
+  Socket and its folder must belong to the user, otherwise another user could
+  have planted them. Folder must not be accessible to anybody else.
+  """
+  try:
+    info = os.lstat(path)
+  except OSError:
+    return False
+  if info.st_uid != os.getuid():
+    return False
+  return not directory or not info.st_mode & 0o077
+
+
+def get_socket_directory():
+  """
+  XDG runtime folder is private already, otherwise a private folder is made
+  in the temporary one
+
+  :returns: folder path, or None if it is not private
+  """
+  directory = os.environ.get('XDG_RUNTIME_DIR')
+  if directory:
+    return directory
+
+  directory = os.path.join(
+      tempfile.gettempdir(), 'crutch-{}'.format(os.getuid()))
+  try:
+    os.mkdir(directory, 0o700)
+  except OSError as error:
+    if error.errno != errno.EEXIST:
+      return None
+  return directory if is_private(directory, directory=True) else None
+
+
+def get_socket_path():
+  path = os.environ.get(ENV_SOCKET)
+  if path:
+    return path
+  directory = get_socket_directory()
+  return os.path.join(directory, 'crutch.sock') if directory else None
+
+
+def send_frame(sock, kind, payload):
+  sock.sendall(FRAME_HEADER.pack(kind, len(payload)) + payload)
+
+
+def recv_exactly(sock, size):
+  data = b''
+  while len(data) < size:
+    chunk = sock.recv(size - len(data))
+    if not chunk:
+      return None
+    data += chunk
+  return data
+
+
+def recv_frame(sock):
+  header = recv_exactly(sock, FRAME_HEADER.size)
+  if header is None:
+    return None, None
+  kind, size = FRAME_HEADER.unpack(header)
+  return kind, recv_exactly(sock, size) if size else b''
+
+#-CLIENT------------------------------------------------------------------------
+
+def forward(argv, path=None, output=None):
+  """
+  Execute `argv` in the daemon, streaming its output into `output`
+
+  :returns: exit code, or None if the command must run locally
+  """
+  if is_local(argv):
+    return None
+
+  path = path or get_socket_path()
+  if not path or not is_private(path):
+    return None
+
+  sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+  try:
+    sock.connect(path)
+  except socket.error:
+    sock.close()
+    return None
+
+  output = output or sys.stdout
+  try:
+    request = {'argv': argv, 'cwd': os.path.abspath('.')}
+    sock.sendall(json.dumps(request).encode('utf-8') + b'\n')
+
+    while True:
+      kind, payload = recv_frame(sock)
+      if kind == FRAME_OUTPUT:
+        output.write(payload)
+        output.flush()
+      elif kind == FRAME_EXIT:
+        return int(payload)
+      elif kind == FRAME_LOCAL:
+        return None
+      else:
+        sys.stderr.write('CRUTCH daemon closed the connection\n')
+        return 1
+  finally:
+    sock.close()
+
+#-SERVER------------------------------------------------------------------------
+
+class OutputCapture(object):
+  """
+  Redirects process-wide stdout and stderr file descriptors into a pipe and
+  pumps it to the client, so output of child processes is captured as well
+  """
+
+  def __init__(self, sock):
+    self.sock = sock
+    self.saved = None
+    self.pipe = None
+    self.pump = None
+
+  def run_pump(self):
+    while True:
+      data = os.read(self.pipe, 64 * 1024)
+      if not data:
+        break
+      try:
+        send_frame(self.sock, FRAME_OUTPUT, data)
+      except socket.error:
+        pass # Client is gone, keep draining
+
+  def __enter__(self):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    self.saved = (os.dup(1), os.dup(2))
+    self.pipe, write = os.pipe()
+    os.dup2(write, 1)
+    os.dup2(write, 2)
+    os.close(write)
+    self.pump = threading.Thread(target=self.run_pump)
+    self.pump.start()
+    return self
+
+  def __exit__(self, *args):
+    sys.stdout.flush()
+    sys.stderr.flush()
+    os.dup2(self.saved[0], 1)
+    os.dup2(self.saved[1], 2)
+    self.pump.join()
+    os.close(self.pipe)
+    for saved in self.saved:
+      os.close(saved)
+
+
+class WarmRuntime(object):
+  """
+  Activated runtime of a single project. It is stale once .crutch.json is
+  changed by anybody but the runtime itself.
+  """
+
+  def __init__(self, driver, runner):
+    self.driver = driver
+    self.runner = runner
+    self.stamp = self.get_stamp()
+
+  def get_stamp(self):
+    try:
+      stat = os.stat(self.driver.renv.get_crutch_config())
+    except OSError:
+      return None
+    return stat.st_mtime, stat.st_size
+
+  def is_stale(self):
+    return self.stamp != self.get_stamp()
+
+  def is_interactive(self, argv):
+    return self.driver.is_interactive(argv)
+
+  def execute(self, argv):
+    result = self.driver.execute(self.runner, argv)
+    self.stamp = self.get_stamp()
+    return result
+
+
+class Daemon(object):
+
+  def __init__(self, create_driver, path=None):
+    self.create_driver = create_driver
+    self.path = path or get_socket_path()
+    self.runtimes = dict()
+
+  def get_runtime(self, directory):
+    runtime = self.runtimes.get(directory, None)
+    if runtime and runtime.is_stale():
+      self.drop_runtime(directory)
+      runtime = None
+
+    if not runtime:
+      driver = self.create_driver()
+      runtime = WarmRuntime(driver, driver.prepare(directory))
+      self.runtimes[directory] = runtime
+
+    return runtime
+
+  def drop_runtime(self, directory):
+    runtime = self.runtimes.pop(directory, None)
+    if runtime:
+      runtime.driver.shutdown()
+
+  def execute(self, argv, cwd):
+    """
+    :returns: tuple of exit code and message
+    """
+    from crutch.core.exceptions import StopException
+
+    os.chdir(cwd)
+    try:
+      return self.get_runtime(cwd).execute(argv)
+    except StopException as stop:
+      self.drop_runtime(cwd)
+      return stop.code, stop.message
+
+  def is_interactive(self, argv, cwd):
+    """
+    Runtime menu tells whether the action reads from the terminal, the
+    daemon has no stdin to forward
+    """
+    from crutch.core.exceptions import StopException
+
+    os.chdir(cwd)
+    try:
+      return self.get_runtime(cwd).is_interactive(argv)
+    except StopException:
+      return False # Let execute report it
+
+  def handle(self, sock):
+    line = sock.makefile('rb').readline()
+    request = json.loads(line.decode('utf-8'))
+
+    if self.is_interactive(request['argv'], request['cwd']):
+      send_frame(sock, FRAME_LOCAL, b'')
+      return
+
+    code = 1
+    with OutputCapture(sock):
+      try:
+        code, message = self.execute(request['argv'], request['cwd'])
+        if message:
+          print(message)
+      except Exception: # pylint: disable=broad-except
+        import traceback
+        traceback.print_exc()
+        self.drop_runtime(request['cwd'])
+
+    send_frame(sock, FRAME_EXIT, str(code).encode('utf-8'))
+
+  def is_listening(self):
+    sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+      sock.connect(self.path)
+      return True
+    except socket.error:
+      return False
+    finally:
+      sock.close()
+
+  def create_server(self):
+    if not self.path:
+      raise RuntimeError('CRUTCH daemon has no private folder for its socket')
+
+    if os.path.lexists(self.path):
+      if not is_private(self.path):
+        raise RuntimeError('CRUTCH daemon socket is not owned by the user')
+      if self.is_listening():
+        raise RuntimeError('CRUTCH daemon is already running at ' + self.path)
+      os.remove(self.path)
+
+    daemon = self
+
+    class Handler(SocketServer.BaseRequestHandler):
+      def handle(self):
+        daemon.handle(self.request)
+
+    umask = os.umask(0o077)
+    try:
+      server = SocketServer.UnixStreamServer(self.path, Handler)
+    finally:
+      os.umask(umask)
+    return server
+
+  def serve(self):
+    server = self.create_server()
+    print('CRUTCH daemon is listening at {}'.format(self.path))
+    try:
+      server.serve_forever()
+    except KeyboardInterrupt:
+      pass
+    finally:
+      server.server_close()
+      os.remove(self.path)
+      for directory in list(self.runtimes):
+        self.drop_runtime(directory)
+    return 0
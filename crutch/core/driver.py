@@ -23,6 +23,8 @@
 from __future__ import unicode_literals
 from __future__ import print_function
 
+import getpass
+import logging
 import sys
 import os
 import io
@@ -30,9 +32,9 @@ import io
 import crutch.core.lifecycle as Lifecycle
 
 from crutch.core.exceptions import StopException
+from crutch.core.profiler import Profiler
 from crutch.core.runtime import RuntimeEnvironment
 from crutch.core.menu import create_crutch_menu
-from crutch.core.repl.prompt import Prompt
 
 class Driver(object): #pragma: no cover
 
@@ -41,6 +43,7 @@ class Driver(object): #pragma: no cover
     self.argv = argv or sys.argv[1:]
     self.renv = None
     self.version = None
+    self.prepared = dict()
 
   def check_crutch_config(self):
     if not os.path.exists(self.renv.get_prop('crutch_config')):
@@ -74,13 +77,41 @@ class Driver(object): #pragma: no cover
           'Minor versions are not compatible: project({}) vs crutch({})'\
           .format(config_version, this_version))
 
-  def create_runtime_environment(self):
+  def create_runtime_environment(self, interactive=True):
     self.renv = RuntimeEnvironment(self.runners)
-    self.renv.set_as_default() # Required by REPL lexer
     self.renv.menu = create_crutch_menu(self.renv)
-    self.renv.prompt = Prompt(self.renv)
+    if interactive:
+      self.renv.set_as_default() # Required by REPL lexer
+
+    # Logging level comes from the project config
+    self.update_tracing()
+    self.renv.lifecycle.add_hook_after(
+        Lifecycle.CONFIG_LOAD, self.update_tracing)
     return self.renv
 
+  def update_tracing(self):
+    """
+    Lifecycle marks are logged at INFO level only, otherwise marks nobody
+    listens to take the dispatch table fast path
+    """
+    if Lifecycle.LOGGER.isEnabledFor(logging.INFO):
+      self.renv.lifecycle.enable_tracing()
+    else:
+      self.renv.lifecycle.disable_tracing()
+
+  def create_prompt(self):
+    # REPL stack pulls in prompt_toolkit and pygments, load it only for prompt
+    from crutch.core.repl.prompt import Prompt
+    self.renv.prompt = Prompt(self.renv)
+    return self.renv.prompt
+
+  def get_login(self):
+    # getlogin fails without a controlling terminal, e.g. in the daemon
+    try:
+      return os.getlogin()
+    except OSError:
+      return getpass.getuser()
+
   def set_default_props(self, project_directory=None):
     defaults = self.renv.get_default_properties()
     defaults['crutch_python'] = sys.executable
@@ -88,7 +119,7 @@ class Driver(object): #pragma: no cover
 
     self.renv.mirror_props_to_config(defaults.keys())
 
-    defaults['sys_login'] = os.getlogin()
+    defaults['sys_login'] = self.get_login()
 
     project_directory = project_directory or self.renv.get_project_directory()
     self.renv.set_prop('project_directory', project_directory)
@@ -140,7 +171,9 @@ class Driver(object): #pragma: no cover
     runner = self.renv.create_runner(self.renv.get_project_type())
     runner.activate_features()
 
-    self.renv.menu.parse(self.renv.get_prop('crutch_argv'))
+    argv = self.renv.get_prop('crutch_argv')
+    runner.activate_on_demand(argv)
+    self.renv.menu.parse(argv)
 
     return runner
 
@@ -167,7 +200,7 @@ class Driver(object): #pragma: no cover
     print("CRUTCH {}".format(self.get_version()))
     print("Home: https://github.com/m4yers/crutch")
 
-    self.renv.prompt.initialize()
+    self.create_prompt().initialize()
     reinitialize_prompt = False
 
     while True:
@@ -191,6 +224,7 @@ class Driver(object): #pragma: no cover
           reinitialize_prompt = True
 
         else:
+          runner.activate_on_demand(argv)
           self.renv.menu.parse(argv)
           runner.run()
 
@@ -208,13 +242,80 @@ class Driver(object): #pragma: no cover
 
     raise StopException()
 
+#-DAEMON------------------------------------------------------------------------
+
+  def prepare(self, project_directory):
+    """
+    Create and activate a runtime for the project without running anything,
+    the daemon keeps it warm and executes commands against it
+    """
+    renv = self.create_runtime_environment(interactive=False)
+    renv.set_prop('crutch_argv', list())
+    self.set_default_props(project_directory)
+    self.check_crutch_config()
+    renv.config_load()
+    self.check_version()
+
+    runner = renv.create_runner(renv.get_project_type())
+    runner.activate_features()
+    self.prepared = dict(renv.props.stage)
+    return runner
+
+  def reset_stage(self):
+    """
+    Drop props staged by previous commands. Props staged while the runtime was
+    prepared are kept unless the config has taken them over since.
+    """
+    props = self.renv.props
+    props.stage.clear()
+    props.stage.update(dict(
+        (k, v) for k, v in self.prepared.items() if k not in props.config))
+
+  def is_interactive(self, argv):
+    action = self.renv.menu.get_action(argv or list())
+    return bool(action) and action.interactive
+
+  def execute(self, runner, argv):
+    """
+    Run a single command against a prepared runtime
+
+    :returns: tuple of exit code and message
+    """
+    renv = self.renv
+    renv.props.cli.clear()
+    self.reset_stage()
+    renv.set_prop('crutch_argv', argv)
+
+    try:
+      runner.activate_on_demand(argv)
+      renv.menu.parse(argv or [runner.default_run_feature])
+      runner.run()
+      renv.config_flush()
+    except StopException as stop:
+      return stop.code, stop.message
+
+    return StopException.EOK, None
+
+  def shutdown(self):
+    try:
+      self.renv.feature_ctrl.deactivate()
+    except StopException:
+      pass
+
+#-CLI---------------------------------------------------------------------------
+
   def run(self):
     code = StopException.EOK
     message = None
 
     try:
       renv = self.create_runtime_environment()
-      renv.lifecycle.enable_tracing()
+
+      # CRUTCH_PROFILE=trace|summary|all writes lifecycle timings to .crutch
+      profile = os.environ.get('CRUTCH_PROFILE')
+      if profile:
+        Profiler(renv, profile)
+
       renv.lifecycle.mark(Lifecycle.CRUTCH_START)
       renv.set_prop('crutch_argv', self.argv)
 
@@ -39,9 +39,9 @@ class FeatureMenu(object):
     self.actions = self.menu.add_actions()
     self.handlers = dict()
 
-  def add_action(self, name, desc, handler):
+  def add_action(self, name, desc, handler, interactive=False):
     self.handlers[name] = handler
-    return self.actions.add_action(name, desc)
+    return self.actions.add_action(name, desc, interactive)
 
   def add_default_action(self, desc, handler):
     return self.add_action('default', desc, handler)
@@ -124,11 +124,19 @@ class FeatureCategory(FeatureProto):
   def activate_features(self, feature_names, set_up=False):
     map(self.activate_feature, feature_names, set_up)
 
+  def create_feature(self, feature_name):
+    """
+    Instantiate the feature and register it as active, neither set up nor
+    activation is performed
+    """
+    instance = self.features[feature_name](self.renv)
+    self.active_features[feature_name] = instance
+    return instance
+
   def activate_feature(self, feature_name, set_up=False):
     if feature_name in self.active_features:
       return
-    instance = self.features[feature_name](self.renv)
-    self.active_features[feature_name] = instance
+    instance = self.create_feature(feature_name)
 
     if set_up:
       self.renv.lifecycle.mark_before(Lifecycle.FEATURE_SET_UP, feature_name)
@@ -186,9 +194,26 @@ class FeatureCategory(FeatureProto):
       raise Exception("You cannot handle non-active feature")
     feature.handle()
 
+  def get_provider(self, name):
+    """
+    Completion provider chaining values of `name` method of active features
+    """
+    def provider(request):
+      for feature in self.active_features.values():
+        method = getattr(feature, name, None)
+        if method:
+          for value in method(request):
+            yield value
+    return provider
+
 
-def create_simple_feature_category(menu):
+def create_simple_feature_category(menu, **providers):
+  """
+  Keyword arguments map menu provider arguments to names of feature methods,
+  see FeatureCategory.get_provider
+  """
   class Class(FeatureCategory):
     def __init__(self, renv, features):
-      super(Class, self).__init__(renv, features, menu(renv))
+      kwargs = dict((k, self.get_provider(v)) for k, v in providers.items())
+      super(Class, self).__init__(renv, features, menu(renv, **kwargs))
   return Class
@@ -22,20 +22,25 @@
 
 import logging
 import uuid
+import sys
 import os
 
-import networkx as nx
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
 from more_itertools import unique_everseen
 
 import crutch.core.lifecycle as Lifecycle
 
 from crutch.core.exceptions import StopException
+from crutch.core.graph import DiGraph
 from crutch.core.features.basics import FeatureCategory
 from crutch.core.replacements import GenerativeReplacementsProvider
 
 LOGGER = logging.getLogger(__name__)
+PROP_JOBS = 'crutch_activation_jobs'
 SINK_CATEGORY = 'sink_category_{}'.format(uuid.uuid1())
+PLAN_CACHE_SIZE = 128
 
 class CategoryDesc(object):
 
@@ -60,12 +65,19 @@ class FeatureCtrlReplProvider(GenerativeReplacementsProvider):
 
   def __init__(self, renv):
     self.renv = renv
+    self.generated_version = None
     GenerativeReplacementsProvider.__init__(self, dict())
 
   def generate(self):
-    self.data = dict()
     ctrl = self.renv.feature_ctrl
 
+    # Nothing was activated nor deactivated since the last call
+    if self.generated_version == ctrl.state_version:
+      return self.data
+
+    self.generated_version = ctrl.state_version
+    self.data = dict()
+
     # Add already active features/categories
     for cat_name, cat_inst in ctrl.active_categories.items():
       self.data['project_feature_category_' + cat_name] = True
@@ -82,11 +94,50 @@ class FeatureCtrlReplProvider(GenerativeReplacementsProvider):
     return self.data
 
 
+class PlanCache(object):
+  """
+  PlanCache stores derived activation/deactivation orders. A plan depends on
+  the request, on what is already active and on the registry contents, so all
+  of these make up the key. Least recently used plans are evicted once there
+  are more than `size` of them, long lived REPL or daemon processes go through
+  many active states.
+  """
+
+  def __init__(self, size=PLAN_CACHE_SIZE):
+    self.plans = OrderedDict()
+    self.size = size
+    self.hits = 0
+    self.misses = 0
+
+  def get(self, key):
+    plan = self.plans.pop(key, None)
+    if plan is None:
+      self.misses += 1
+      return None
+    self.plans[key] = plan
+    self.hits += 1
+    total_order, flatten_order = plan
+    return list(total_order), list(flatten_order)
+
+  def put(self, key, total_order, flatten_order):
+    self.plans.pop(key, None)
+    self.plans[key] = (tuple(total_order), tuple(flatten_order))
+    while len(self.plans) > self.size:
+      self.plans.popitem(last=False)
+
+  def clear(self):
+    self.plans = OrderedDict()
+
+  def __str__(self):
+    return '[PlanCache plans: {}, hits: {}, misses: {}]'.format(
+        len(self.plans), self.hits, self.misses)
+
+
 class FeatureCtrl(object):
 
   def __init__(self, renv):
     self.renv = renv
-    self.dep_graph = nx.DiGraph() # it is more like a forest of trees
+    self.dep_graph = DiGraph() # it is more like a forest of trees
     self.features = dict()
     self.feature_to_category = dict()
     self.features_in_activation_process = None
@@ -95,6 +146,10 @@ class FeatureCtrl(object):
         self.sink_category_name, FeatureCategory, [], [], [], False)
     self.categories = {self.sink_category_name : self.sink_category}
     self.active_categories = dict()
+    self.ancestors = None
+    self.registry_version = 0
+    self.state_version = 0
+    self.plan_cache = PlanCache()
     renv.repl.add_provider('feature-ctrl-repl', FeatureCtrlReplProvider(renv))
 
   def __repr__(self):
@@ -118,13 +173,61 @@ class FeatureCtrl(object):
   def is_feature(self, name):
     return name in self.features
 
+  def invalidate_dependency_index(self):
+    """
+    Drop transitive ancestors index, it will be rebuilt upon next closure
+    query. Must be called whenever the dependency graph changes.
+    """
+    self.ancestors = None
+    self.registry_version += 1
+    self.plan_cache.clear()
+
+  def build_dependency_index(self):
+    """
+    Build transitive ancestors(dependencies) set for every node of the
+    dependency graph. Nodes are visited in topological order so every
+    predecessor's set is complete by the time it is merged.
+    """
+    ancestors = dict()
+
+    for name in self.dep_graph.topological_sort():
+      closure = set()
+      for dep_name in self.dep_graph.predecessors(name):
+        closure.add(dep_name)
+        closure |= ancestors[dep_name]
+      ancestors[name] = closure
+
+    self.ancestors = ancestors
+
+  def get_ancestors(self):
+    if self.ancestors is None:
+      self.build_dependency_index()
+    return self.ancestors
+
   def get_topological_order(self, request):
-    subgraph = self.dep_graph.subgraph(request)
-    return list(nx.topological_sort(subgraph))
+    return self.dep_graph.topological_sort(request)
 
   def get_reversed_topological_order(self, request):
-    subgraph = self.dep_graph.subgraph(request).reverse()
-    return list(nx.topological_sort(subgraph))
+    return self.dep_graph.topological_sort(request, reverse=True)
+
+  def get_active_state(self):
+    """
+    Return hashable snapshot of active categories and features.
+    """
+    return frozenset(
+        (cat_name, ftr_name)
+        for cat_name, cat_inst in self.active_categories.items()
+        for ftr_name in [None] + list(cat_inst.get_active_feature_names()))
+
+  def get_plan_key(self, kind, request, skip=None):
+    if not isinstance(request, basestring):
+      request = frozenset(request)
+    return (
+        kind,
+        request,
+        frozenset(skip or []),
+        self.get_active_state(),
+        self.registry_version)
 
   def get_name_errors(self, names):
     """
@@ -146,13 +249,11 @@ class FeatureCtrl(object):
     :return: `set` containing iterative dependency closure of `features`. May
       contain category names.
     """
+    ancestors = self.get_ancestors()
     closure = set(features)
 
-    while True:
-      new = closure | set(sum(map(self.dep_graph.predecessors, closure), []))
-      if closure == new:
-        break
-      closure = new
+    for name in list(closure):
+      closure |= ancestors.get(name, set())
 
     return closure
 
@@ -253,6 +354,11 @@ class FeatureCtrl(object):
     :returns: total activation order.
     """
 
+    key = self.get_plan_key('activation', request)
+    plan = self.plan_cache.get(key)
+    if plan is not None:
+      return plan
+
     if request == 'default':
       request = sum([d.defaults for d in self.categories.values()], [])
 
@@ -269,6 +375,8 @@ class FeatureCtrl(object):
     total_order = self.clean_up_activation_order(total_order)
     flatten_order = [f for f in total_order if f in flatten]
 
+    self.plan_cache.put(key, total_order, flatten_order)
+
     return total_order, flatten_order
 
   def get_deactivation_order(self, request, skip=None):
@@ -278,6 +386,11 @@ class FeatureCtrl(object):
     :param request: `iterable` of feature and categories names
     :returns: total deactivation order.
     """
+    key = self.get_plan_key('deactivation', request, skip)
+    plan = self.plan_cache.get(key)
+    if plan is not None:
+      return plan
+
     if request == 'all':
       request = self.categories.keys()
 
@@ -289,12 +402,7 @@ class FeatureCtrl(object):
 
     flatten = self.flatten_with_active(request)
 
-    closure = set(flatten)
-    while True:
-      new = closure | set(self.get_features_dependency_closure(closure))
-      if closure == new:
-        break
-      closure = new
+    closure = self.get_features_dependency_closure(flatten)
 
     if skip:
       for name in skip:
@@ -316,6 +424,8 @@ class FeatureCtrl(object):
     total_order = self.clean_up_deactivation_order(total_order)
     flatten_order = [f for f in total_order if f in flatten]
 
+    self.plan_cache.put(key, total_order, flatten_order)
+
     return total_order, flatten_order
 
   def get_mono_conflicts(self, features):
@@ -351,7 +461,127 @@ class FeatureCtrl(object):
       if cat_inst and cat_desc.mono:
         yield cat_name, ftr_name
 
-  def activate_features(self, request, set_up=False):
+  def activate_category(self, cat_name, set_up=False):
+    """
+    Return active instance of the category, instantiating, setting up and
+    activating it first if necessary.
+    """
+    cat_inst = self.active_categories.get(cat_name, None)
+    if cat_inst:
+      return cat_inst
+
+    cat_desc = self.categories[cat_name]
+    cat_inst = cat_desc.init(
+        self.renv,
+        {n: self.features[n].init for n in cat_desc.features})
+
+    if set_up:
+      self.renv.lifecycle.mark_before(Lifecycle.CATEGORY_SET_UP, cat_name)
+      cat_inst.set_up()
+      self.renv.lifecycle.mark_after(Lifecycle.CATEGORY_SET_UP, cat_name)
+
+    self.renv.lifecycle.mark_before(Lifecycle.CATEGORY_ACTIVATE, cat_name)
+    cat_inst.activate()
+    self.renv.lifecycle.mark_after(Lifecycle.CATEGORY_ACTIVATE, cat_name)
+
+    self.active_categories[cat_name] = cat_inst
+
+    return cat_inst
+
+  def get_activation_levels(self, total_order):
+    """
+    Split total activation order into dependency levels. Features of the same
+    level do not depend on each other, directly or through a category, and
+    depend only on features of previous levels.
+
+    :param total_order: `list` total activation order
+    :returns: `list` of feature name `list`s, each preserving total order
+    """
+    levels = dict()
+    result = list()
+
+    for ftr_name in total_order:
+      deps = set()
+      for dep_name in self.dep_graph.predecessors(ftr_name):
+        if self.is_category(dep_name):
+          deps.update(self.categories[dep_name].features)
+        else:
+          deps.add(dep_name)
+
+      level = 1 + max([levels[d] for d in deps if d in levels] or [-1])
+      levels[ftr_name] = level
+
+      if level == len(result):
+        result.append(list())
+      result[level].append(ftr_name)
+
+    return result
+
+  def run_features_phase(self, pool, phase, instances, method):
+    """
+    Call `method` of every instance on the pool. Workers only time their
+    calls, lifecycle marks are emitted afterwards from the calling thread in
+    `instances` order, each pair carrying the times of its own call. The
+    first failure in `instances` order is raised once all marks are out.
+
+    :param instances: `list` of (feature name, feature instance) pairs
+    """
+    lifecycle = self.renv.lifecycle
+
+    def run(pair):
+      start = lifecycle.clock()
+      error = None
+      try:
+        getattr(pair[1], method)()
+      except Exception: # pylint: disable=broad-except
+        error = sys.exc_info()
+      return start, lifecycle.clock(), error
+
+    results = pool.map(run, instances)
+
+    failure = None
+    for (ftr_name, _), (start, end, error) in zip(instances, results):
+      lifecycle.mark_before(phase, ftr_name, start)
+      lifecycle.mark_after(phase, ftr_name, end)
+      failure = failure or error
+
+    if failure:
+      raise failure[0], failure[1], failure[2]
+
+  def activate_features_parallel(self, total_order, set_up, jobs):
+    """
+    Activate features level by level. Categories and features are still
+    instantiated sequentially, since constructors register menus and look up
+    other features, but set up and activation of the features within a level
+    run on a thread pool.
+
+    Features of a level render templates concurrently. FeatureJinja fetches
+    replacements under its lock and every copy_folder renders from its own
+    snapshot of them, so the shared jinja globals are never read mid-update.
+    """
+    pool = ThreadPool(jobs)
+
+    try:
+      for level in self.get_activation_levels(total_order):
+        instances = list()
+
+        for ftr_name in level:
+          cat_inst = self.activate_category(
+              self.feature_to_category[ftr_name], set_up)
+          if not cat_inst.is_active_feature(ftr_name):
+            instances.append((ftr_name, cat_inst.create_feature(ftr_name)))
+
+        if set_up:
+          self.run_features_phase(
+              pool, Lifecycle.FEATURE_SET_UP, instances, 'set_up')
+
+        self.run_features_phase(
+            pool, Lifecycle.FEATURE_ACTIVATE, instances, 'activate')
+    finally:
+      pool.close()
+      pool.join()
+
+  def activate_features(self, request, set_up=False, jobs=None):
     self.renv.lifecycle.mark_before(Lifecycle.FEATURE_CREATION, request)
 
     total_order, flatten_order = self.get_activation_order(request)
@@ -394,33 +624,23 @@ class FeatureCtrl(object):
           'There were some conflicting dependencies:\n' + '\n'.join(conflicts))
 
     self.features_in_activation_process = list(total_order)
+    self.state_version += 1
 
     # Finally instantiate, activate and set up if needed all the features
-    for ftr_name in total_order:
-      cat_name = self.feature_to_category[ftr_name]
-      cat_desc = self.categories[cat_name]
-      cat_inst = self.active_categories.get(cat_name, None)
-
-      if not cat_inst:
-        cat_inst = cat_desc.init(
-            self.renv,
-            {n: self.features[n].init for n in cat_desc.features})
-
-        if set_up:
-          self.renv.lifecycle.mark_before(Lifecycle.CATEGORY_SET_UP, cat_name)
-          cat_inst.set_up()
-          self.renv.lifecycle.mark_after(Lifecycle.CATEGORY_SET_UP, cat_name)
-
-        self.renv.lifecycle.mark_before(Lifecycle.CATEGORY_ACTIVATE, cat_name)
-        cat_inst.activate()
-        self.renv.lifecycle.mark_after(Lifecycle.CATEGORY_ACTIVATE, cat_name)
-
-        self.active_categories[cat_name] = cat_inst
-
-      if not cat_inst.is_active_feature(ftr_name):
-        cat_inst.activate_feature(ftr_name, set_up=set_up)
+    if jobs is None:
+      jobs = self.renv.get_prop(PROP_JOBS)
+
+    if jobs and int(jobs) > 1:
+      self.activate_features_parallel(total_order, set_up, int(jobs))
+    else:
+      for ftr_name in total_order:
+        cat_inst = self.activate_category(
+            self.feature_to_category[ftr_name], set_up)
+        if not cat_inst.is_active_feature(ftr_name):
+          cat_inst.activate_feature(ftr_name, set_up=set_up)
 
     self.features_in_activation_process = None
+    self.state_version += 1
 
     self.renv.lifecycle.mark_after(Lifecycle.FEATURE_CREATION, total_order)
 
@@ -485,6 +705,7 @@ class FeatureCtrl(object):
 
       if cat_inst and cat_inst.is_active_feature(ftr_name):
         cat_inst.deactivate_feature(ftr_name, tear_down)
+        self.state_version += 1
 
         if cat_inst.get_active_features():
           continue
@@ -500,6 +721,7 @@ class FeatureCtrl(object):
           self.renv.lifecycle.mark_after(Lifecycle.CATEGORY_TEAR_DOWN, cat_name)
 
         del self.active_categories[cat_name]
+        self.state_version += 1
 
     self.renv.lifecycle.mark_after(Lifecycle.FEATURE_DESTRUCTION, total_order)
 
@@ -575,6 +797,8 @@ class FeatureCtrl(object):
       self.feature_to_category[ftr_name] = cat_name
       self.sink_category.features.remove(ftr_name)
 
+    self.invalidate_dependency_index()
+
   def register_feature_class(self, ftr_name, ftr_class, requires=None):
     """
     Register feature. Every name mentioned in its configuration must be
@@ -604,6 +828,8 @@ class FeatureCtrl(object):
     self.feature_to_category[ftr_name] = self.sink_category_name
     self.sink_category.features.append(ftr_name)
 
+    self.invalidate_dependency_index()
+
   def activate(self):
     try:
       return self.activate_features(self.renv.get_project_features())
@@ -21,10 +21,10 @@
 # OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 
-import prompter
-
 from crutch.core.exceptions import StopException
 from crutch.core.features.basics import Feature, FeatureMenu
+from crutch.core.features.jinja import PROP_UPDATE
+from crutch.core.features.new import copy_project_templates
 
 
 NAME = 'feature'
@@ -34,7 +34,8 @@ OPT_FEATURES = 'feature_feature_features'
 class FeatureMenuCppFileManager(FeatureMenu):
 
   def __init__(
-      self, renv, handler_view=None, handler_add=None, handler_remove=None):
+      self, renv, handler_view=None, handler_add=None, handler_remove=None,
+      handler_update=None):
     super(FeatureMenuCppFileManager, self).__init__(
         renv, NAME, 'Feature Manager')
 
@@ -47,13 +48,19 @@ class FeatureMenuCppFileManager(FeatureMenu):
         nargs='*',
         help='Feature to activate')
 
-    remove = self.add_action('remove', 'Add features', handler_remove)
+    remove = self.add_action(
+        'remove', 'Add features', handler_remove, interactive=True)
     remove.add_argument(
         dest=OPT_FEATURES,
         metavar='FEATURE',
         nargs='*',
         help='Feature to deactivate')
 
+    self.add_action(
+        'update',
+        'Re-render unmodified files of the project and active features',
+        handler_update)
+
 
 class FeatureStatus(object):
 
@@ -88,7 +95,8 @@ class FeatureFeature(Feature):
         renv,
         handler_view=self.action_view,
         handler_add=self.action_add,
-        handler_remove=self.action_remove))
+        handler_remove=self.action_remove,
+        handler_update=self.action_update))
 
 #-SUPPORT-----------------------------------------------------------------------
 
@@ -136,6 +144,7 @@ class FeatureFeature(Feature):
     print 'FEATURE VIEW:'
     for cat_status in self.get_categories_status():
       print '\n{}'.format(cat_status)
+    print '\n{}'.format(self.renv.feature_ctrl.plan_cache)
 
   def action_add(self):
     names = self.renv.get_prop(OPT_FEATURES)
@@ -154,6 +163,7 @@ class FeatureFeature(Feature):
     if not flatten_order:
       raise StopException("There is nothing to remove")
 
+    import prompter
     if not prompter.yesno("Do you really want to remove {}".format(names)):
       raise StopException("Nothing was removed")
 
@@ -165,3 +175,15 @@ class FeatureFeature(Feature):
     self.renv.set_prop('project_features', flatten_order, mirror_to_config=True)
 
     print("Removed {}".format(flatten_order))
+
+  def action_update(self):
+    ctrl = self.renv.feature_ctrl
+    self.renv.set_prop(PROP_UPDATE, True)
+    try:
+      copy_project_templates(self.renv, ctrl.get_active_feature('jinja'))
+      for cat_inst in ctrl.active_categories.values():
+        cat_inst.set_up()
+    finally:
+      self.renv.del_prop(PROP_UPDATE)
+
+    print("Updated {}".format(sorted(ctrl.active_categories.keys())))
@@ -20,15 +20,24 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
 # OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
+import threading
+import hashlib
+import fcntl
 import codecs
 import shutil
+import stat
+import tempfile
+import errno
+import json
 import re
 import os
 
-from pkg_resources import Requirement, resource_filename
+from collections import OrderedDict
+from multiprocessing.pool import ThreadPool
 
-import jinja2
+import crutch.core.lifecycle as Lifecycle
 
+from crutch.core.bundle import TemplateBundle
 from crutch.core.features.basics import Feature
 
 
@@ -37,14 +46,304 @@ RE_DOT_HIDDEN = re.compile(r'.*/\..*$')
 RE_JINJA_EXT = re.compile(r'\.(j2|jinja|jinja2)$')
 RE_JINJA_FILE = re.compile(r'.*\.(j2|jinja|jinja2)$')
 
+PROP_CATALOG = 'crutch_jinja_catalog'
+PROP_BYTECODE = 'crutch_jinja_bytecode'
+PROP_JOBS = 'crutch_jinja_jobs'
+PROP_UPDATE = 'crutch_jinja_update'
+PROP_LINK = 'crutch_jinja_link'
+CATALOG_FILE = 'jinja-catalog.json'
+MANIFEST_FILE = 'jinja-manifest.json'
+DIGESTS_FILE = 'digests.json'
+COPY_BUFFER = 1024 * 1024
+FICLONE = 0x40049409 # Linux copy-on-write clone ioctl
+WRITABLE = stat.S_IWUSR | stat.S_IWGRP | stat.S_IWOTH
+CATALOGS = dict()
+CATALOGS_LOCK = threading.Lock()
+REWRITERS = OrderedDict()
+REWRITERS_LOCK = threading.Lock()
+REWRITERS_SIZE = 64
+BUNDLES = dict()
+BUNDLE_FILE = os.path.join(
+    os.path.dirname(__file__), '..', '..', 'templates.zip')
+
+
+class TemplateCatalog(object):
+  """
+  Prefix trie of template names. Every node is a dict of path segments, a
+  template itself is marked by an empty segment.
+  """
+
+  LEAF = ''
+
+  def __init__(self, names):
+    self.names = sorted(names)
+    self.root = dict()
+    self.subtrees = dict()
+
+    for name in self.names:
+      node = self.root
+      for part in name.split('/'):
+        node = node.setdefault(part, dict())
+      node[TemplateCatalog.LEAF] = name
+
+  def collect(self, node, result):
+    for part, child in sorted(node.items()):
+      if part == TemplateCatalog.LEAF:
+        result.append(child)
+      else:
+        self.collect(child, result)
+    return result
+
+  def list_templates(self, prefix=''):
+    """
+    Return names of all the templates found under `prefix` directory
+    """
+    result = self.subtrees.get(prefix, None)
+    if result is not None:
+      return result
+
+    node = self.root
+    for part in [p for p in prefix.split('/') if p]:
+      node = node.get(part, None)
+      if node is None:
+        break
+
+    result = self.collect(node, list()) if node else list()
+    self.subtrees[prefix] = result
+    return result
+
+
+class PathRewriter(object):
+  """
+  Compiled path substitutions. If every pattern is a plain token they are
+  merged into a single alternation with longest tokens first, and replaced
+  literally in one pass. Otherwise the patterns are applied one after another
+  as regular expressions.
+  """
+
+  def __init__(self, mapping):
+    self.table = dict(mapping)
+    self.regex = None
+    self.rules = None
+
+    if all(re.escape(k) == k for k in self.table):
+      tokens = sorted(self.table, key=lambda k: (-len(k), k))
+      self.regex = re.compile('|'.join(tokens))
+    else:
+      self.rules = [(re.compile(k), v) for k, v in self.table.items()]
+
+  def replace(self, match):
+    return self.table[match.group(0)]
+
+  def rewrite(self, path):
+    if self.regex:
+      return self.regex.sub(self.replace, path)
+    for regex, repl in self.rules:
+      path = regex.sub(repl, path)
+    return path
+
+
+def get_path_rewriter(path_repl):
+  """
+  Return rewriter for the mapping, rewriters are shared by equal mappings.
+  Least recently used ones are evicted, a daemon sees mappings of many
+  projects.
+  """
+  if not path_repl:
+    return None
+  key = tuple(sorted(path_repl.items()))
+  with REWRITERS_LOCK:
+    rewriter = REWRITERS.pop(key, None) or PathRewriter(path_repl)
+    REWRITERS[key] = rewriter
+    while len(REWRITERS) > REWRITERS_SIZE:
+      REWRITERS.popitem(last=False)
+  return rewriter
+
+
+def get_bundle(filename=BUNDLE_FILE):
+  """
+  Return the packed templates bundle if one was built, it is opened once per
+  process
+  """
+  filename = os.path.abspath(filename)
+  with CATALOGS_LOCK:
+    if filename not in BUNDLES:
+      BUNDLES[filename] = \
+          TemplateBundle(filename) if os.path.exists(filename) else None
+    return BUNDLES[filename]
+
+
+def get_templates_directory():
+  # pkg_resources is slow to import, only pay for it without a bundle
+  from pkg_resources import Requirement, resource_filename
+  return resource_filename(Requirement.parse('crutch'), 'templates')
+
+
+def get_templates_stamp(templates):
+  """
+  Fingerprint of the templates folder or bundle by a single stat, walking the
+  tree would cost as much as listing it. A reinstall replaces the folder, but
+  templates added deeper in a dev checkout are seen only once the folder
+  itself is touched.
+  """
+  info = os.stat(templates)
+  return '{}:{!r}:{}'.format(info.st_size, info.st_mtime, info.st_ino)
+
+
+def get_digest(content):
+  if isinstance(content, unicode):
+    content = content.encode('utf-8')
+  return hashlib.sha1(content).hexdigest()
+
+
+def get_file_digest(filename):
+  digest = hashlib.sha1()
+  with open(filename, 'rb') as fin:
+    for chunk in iter(lambda: fin.read(COPY_BUFFER), b''):
+      digest.update(chunk)
+  return digest.hexdigest()
+
+
+def get_file_stamp(filename):
+  info = os.stat(filename)
+  return [info.st_size, info.st_mtime]
+
+
+def is_edited(filename, output):
+  """
+  Outputs are recorded as a digest of rendered content, or as a stamp of the
+  cloned file which is never read
+  """
+  if isinstance(output, list):
+    return get_file_stamp(filename) != output
+  return get_file_digest(filename) != output
+
+
+def clone_file(src, dst, link=False):
+  """
+  Copy `src` to `dst` avoiding a byte by byte copy where the filesystem
+  allows: a hard link if `link` is set, then a copy-on-write clone, then a
+  plain buffered copy. An existing `dst` is unlinked first.
+
+  A hard link shares its content with `src`, so an in-place edit of `dst`
+  would change the installed template. Only read-only sources are linked.
+  """
+  if os.path.lexists(dst):
+    os.remove(dst)
+
+  if link and not os.stat(src).st_mode & WRITABLE:
+    try:
+      os.link(src, dst)
+      return
+    except OSError:
+      pass
+
+  with open(src, 'rb') as fsrc:
+    with open(dst, 'wb') as fdst:
+      try:
+        fcntl.ioctl(fdst.fileno(), FICLONE, fsrc.fileno())
+        return
+      except (IOError, OSError):
+        pass
+      shutil.copyfileobj(fsrc, fdst, COPY_BUFFER)
+
+
+class TemplateManifest(object):
+  """
+  Record of every materialized file, keyed by its path relative to the project
+  directory. An entry holds the template name, digest of the template source,
+  digest of the replacements the template used and digest of the output.
+  Templates are digested in update mode only, without them update falls back
+  to re-rendering files the user has not edited. Cloned files are recorded by
+  their size and mtime instead of an output digest.
+  """
+
+  def __init__(self, filename, root):
+    self.filename = filename
+    self.root = root
+    self.entries = dict()
+    self.dirty = False
+
+    if os.path.exists(filename):
+      with codecs.open(filename, 'r', 'utf-8') as fin:
+        try:
+          self.entries = json.load(fin)
+        except ValueError:
+          self.entries = dict()
+
+  def get_key(self, filename):
+    return os.path.relpath(os.path.abspath(filename), self.root)
+
+  def get(self, filename):
+    return self.entries.get(self.get_key(filename), None)
+
+  def record(self, filename, template, source, inputs, output):
+    entry = {
+        'template': template,
+        'source': source,
+        'inputs': inputs,
+        'output': output}
+    key = self.get_key(filename)
+    if self.entries.get(key) != entry:
+      self.entries[key] = entry
+      self.dirty = True
+
+  def save(self):
+    if not self.dirty:
+      return False
+    with codecs.open(self.filename, 'w', 'utf-8') as fout:
+      json.dump(self.entries, fout, sort_keys=True, indent=2)
+    self.dirty = False
+    return True
+
 
 class FeatureJinja(Feature):
+  """
+  Templates location and jinja environment are resolved on first use, most
+  CRUTCH invocations never render anything and need neither pkg_resources nor
+  jinja2
+  """
 
   def __init__(self, renv):
     super(FeatureJinja, self).__init__(renv)
-    templates = resource_filename(Requirement.parse('crutch'), 'templates')
-    self.jenv = jinja2.Environment(loader=jinja2.FileSystemLoader(templates))
+    self.bundle = get_bundle()
+    self.template_root = None
+    self.environment = None
     self.current_jinja_globals = list()
+    self.lock = threading.Lock()
+    self.bytecode_ready = False
+    self.variables = dict()
+    self.digests = None
+    self.digests_changed = False
+
+  @property
+  def templates(self):
+    if self.template_root is None:
+      if self.bundle:
+        self.template_root = self.bundle.filename
+      else:
+        self.template_root = get_templates_directory()
+    return self.template_root
+
+  @templates.setter
+  def templates(self, value):
+    self.template_root = value
+
+  @property
+  def jenv(self):
+    if self.environment is None:
+      import jinja2
+      if self.bundle:
+        from crutch.core.features.loader import BundleLoader
+        loader = BundleLoader(self.bundle)
+      else:
+        loader = jinja2.FileSystemLoader(self.templates)
+      self.environment = jinja2.Environment(loader=loader)
+    return self.environment
+
+  @jenv.setter
+  def jenv(self, value):
+    self.environment = value
 
 #-SUPPORT-----------------------------------------------------------------------
 
@@ -58,49 +357,386 @@ class FeatureJinja(Feature):
     for glob in self.current_jinja_globals:
       del self.current_jinja_globals[glob]
 
-    # Then, populate with fresh ones
-    self.renv.repl.fetch()
-    self.jenv.globals.update(self.renv.repl)
+    # Then, populate with fresh ones. Features may be set up concurrently, so
+    # replacements must not be fetched by several threads at once, and the
+    # caller gets a snapshot to render from
+    with self.lock:
+      self.renv.repl.fetch()
+      self.jenv.globals.update(self.renv.repl)
+      return dict(self.jenv.globals)
 
-#-API---------------------------------------------------------------------------
+  def get_catalog_filename(self):
+    crutch_directory = self.renv.get_crutch_directory()
+    if not crutch_directory:
+      return None
+    return os.path.join(crutch_directory, CATALOG_FILE)
+
+  def load_catalog(self):
+    """
+    Read persisted template names if they were listed from the same templates
+    folder, unchanged since, by the same CRUTCH version
+    """
+    filename = self.get_catalog_filename()
+    if not filename or not os.path.exists(filename):
+      return None
+
+    with codecs.open(filename, 'r', 'utf-8') as fin:
+      try:
+        data = json.load(fin)
+      except ValueError:
+        return None
+
+    if data.get('templates') != self.templates or \
+       data.get('version') != self.renv.get_prop('crutch_version') or \
+       data.get('stamp') != get_templates_stamp(self.templates):
+      return None
+
+    return data.get('names', None)
 
-  def copy_folder(self, src_dir, dst_dir, path_repl=None):
-    jenv = self.jenv
+  def save_catalog(self, catalog):
+    filename = self.get_catalog_filename()
+    if not filename or not os.path.exists(os.path.dirname(filename)):
+      return
 
-    self.mirror_repl_to_jinja_globals()
+    with codecs.open(filename, 'w', 'utf-8') as fout:
+      json.dump({
+          'templates': self.templates,
+          'version': self.renv.get_prop('crutch_version'),
+          'stamp': get_templates_stamp(self.templates),
+          'names': catalog.names}, fout)
 
-    re_tmpl_prefix = re.compile(r'^' + src_dir)
-    templates = filter(re_tmpl_prefix.match, jenv.list_templates())
+  def get_catalog(self):
+    """
+    Return the catalog of all available templates. It is built once per
+    process, and if `crutch_jinja_catalog` property is set persisted to the
+    .crutch directory as well
+    """
+    with CATALOGS_LOCK:
+      catalog = CATALOGS.get(self.templates, None)
+      if catalog:
+        return catalog
+
+      persist = self.renv.get_prop(PROP_CATALOG)
+      names = self.load_catalog() if persist else None
+
+      if names is None:
+        catalog = TemplateCatalog(self.jenv.list_templates())
+        if persist:
+          self.save_catalog(catalog)
+      else:
+        catalog = TemplateCatalog(names)
 
-    for tmpl_src in templates:
-      filename = re_tmpl_prefix.sub('', tmpl_src)
+      CATALOGS[self.templates] = catalog
+      return catalog
+
+  def get_bytecode_directory(self):
+    """
+    Compiled templates are stored per user, `crutch_jinja_bytecode` property
+    overrides the location. Every CRUTCH version gets its own folder.
+    """
+    directory = self.renv.get_prop(PROP_BYTECODE)
+    if not directory:
+      cache = os.environ.get('XDG_CACHE_HOME') or \
+          os.path.join(os.path.expanduser('~'), '.cache')
+      directory = os.path.join(cache, 'crutch', 'jinja')
+    version = self.renv.get_prop('crutch_version') or 'unknown'
+    return os.path.join(directory, version)
+
+  def enable_bytecode_cache(self):
+    """
+    Attach on-disk bytecode cache to the environment. Jinja invalidates a
+    cached template once its source checksum changes. This is done lazily
+    since CRUTCH version is not known when the feature is created during
+    `new`.
+    """
+    with self.lock:
+      if self.bytecode_ready:
+        return
+      self.bytecode_ready = True
+
+      directory = self.get_bytecode_directory()
+      try:
+        if not os.path.exists(directory):
+          os.makedirs(directory)
+      except OSError as error:
+        if error.errno != errno.EEXIST:
+          return
+
+      from crutch.core.features.loader import BytecodeCache
+      self.jenv.bytecode_cache = BytecodeCache(directory)
+
+  def get_manifest(self):
+    """
+    Manifest lives in the .crutch directory, so there is none until the
+    project is created
+    """
+    crutch_directory = self.renv.get_crutch_directory()
+    if not crutch_directory or not os.path.exists(crutch_directory):
+      return None
+    return TemplateManifest(
+        os.path.join(crutch_directory, MANIFEST_FILE),
+        os.path.dirname(os.path.abspath(crutch_directory)))
+
+  def get_source(self, tmpl_src):
+    """
+    Return template source and its digest
+    """
+    source, _, _ = self.jenv.loader.get_source(self.jenv, tmpl_src)
+    return source, get_digest(source)
+
+  def get_asset_filename(self, tmpl_src):
+    return os.path.join(self.templates, *tmpl_src.split('/'))
+
+  def get_digests_filename(self):
+    return os.path.join(self.get_bytecode_directory(), DIGESTS_FILE)
+
+  def load_digests(self):
+    """
+    Asset digests are kept per user next to compiled templates, so an asset
+    is read once until its size, mtime or inode changes
+    """
+    with self.lock:
+      if self.digests is None:
+        self.digests = dict()
+        try:
+          with codecs.open(self.get_digests_filename(), 'r', 'utf-8') as fin:
+            self.digests = json.load(fin)
+        except (IOError, OSError, ValueError):
+          pass
+      return self.digests
+
+  def save_digests(self):
+    """
+    Write digests atomically, an unwritable cache directory is ignored
+    """
+    if not self.digests_changed:
+      return
+    self.digests_changed = False
+
+    directory = os.path.dirname(self.get_digests_filename())
+    try:
+      handle, temp = tempfile.mkstemp(dir=directory, suffix='.tmp')
+    except (IOError, OSError):
+      return
+
+    try:
+      with os.fdopen(handle, 'w') as fout:
+        json.dump(self.digests, fout)
+      os.rename(temp, self.get_digests_filename())
+    except (IOError, OSError):
+      if os.path.exists(temp):
+        os.remove(temp)
+
+  def get_asset_digest(self, tmpl_src):
+    """
+    Digest of a non-template file. Bundles carry digests in their index,
+    otherwise it is cached by the file stat.
+    """
+    if self.bundle:
+      return self.bundle.digests[tmpl_src]
+
+    filename = self.get_asset_filename(tmpl_src)
+    info = os.stat(filename)
+    key = [info.st_size, info.st_mtime, info.st_ino]
+    digests = self.load_digests()
+
+    known = digests.get(filename, None)
+    if known and known[:3] == key:
+      return known[3]
+
+    digest = get_file_digest(filename)
+    digests[filename] = key + [digest]
+    self.digests_changed = True
+    return digest
+
+  def copy_asset(self, tmpl_src, filename):
+    if self.bundle:
+      if os.path.lexists(filename):
+        os.remove(filename)
+      self.bundle.extract(tmpl_src, filename)
+    else:
+      clone_file(
+          self.get_asset_filename(tmpl_src),
+          filename,
+          bool(self.renv.get_prop(PROP_LINK)))
+
+  def get_inputs_digest(self, tmpl_src, source, digest, context=None):
+    """
+    Digest of the globals the template refers to. Names are looked up once
+    per template source, local names are included too which is harmless.
+    """
+    key = (tmpl_src, digest)
+    names = self.variables.get(key, None)
+    if names is None:
+      from jinja2.nodes import Name
+      ast = self.jenv.parse(source)
+      names = sorted(set(
+          n.name for n in ast.find_all(Name) if n.ctx == 'load'))
+      self.variables[key] = names
+
+    context = self.jenv.globals if context is None else context
+    inputs = dict((name, context.get(name)) for name in names)
+    return get_digest(json.dumps(inputs, sort_keys=True, default=repr))
+
+#-API---------------------------------------------------------------------------
+
+  def plan_folder(self, src_dir, dst_dir, path_repl=None, update=False):
+    """
+    Map every template under `src_dir` to its destination file.
+
+    :returns: `list` of (template name, destination filename, is jinja
+      template) tuples. Existing plain files are left out unless in `update`
+      mode, templates are always rendered again.
+    """
+    prefix = src_dir.rstrip('/') + '/'
+    rewriter = get_path_rewriter(path_repl)
+    plan = list()
+
+    for tmpl_src in self.get_catalog().list_templates(src_dir):
+      filename = tmpl_src[len(prefix) - 1:]
 
       # Apply path substitutions if any
-      if path_repl:
-        for repl in path_repl.keys():
-          regex = re.compile(repl)
-          filename = regex.sub(path_repl[repl], filename)
+      if rewriter:
+        filename = rewriter.rewrite(filename)
 
       filename = dst_dir + filename
 
       # Do not override existing files
-      if os.path.exists(filename):
+      if not update and os.path.exists(filename):
         continue
 
-      # Create the containing folder if does not exist already
-      folder = os.path.dirname(filename)
-      if not os.path.exists(folder):
-        os.makedirs(folder)
+      # Drop .jinja extension
+      is_jinja = RE_JINJA_FILE.match(filename) is not None
+      if is_jinja:
+        filename = RE_JINJA_EXT.sub('', filename)
 
-      tmpl = jenv.get_template(tmpl_src)
+      plan.append((tmpl_src, filename, is_jinja))
 
-      # If the file is not a template just copy it
-      if not RE_JINJA_FILE.match(filename):
-        shutil.copyfile(tmpl.filename, filename)
+    return plan
+
+  def make_folders(self, plan):
+    """
+    Create every missing destination folder of the plan, parents first
+    """
+    for folder in sorted(set(os.path.dirname(f) for _, f, _ in plan)):
+      if os.path.exists(folder):
         continue
+      try:
+        os.makedirs(folder)
+      except OSError as error:
+        # Some other thread might have just created it
+        if error.errno != errno.EEXIST:
+          raise
+
+  def is_up_to_date(self, filename, previous, source, inputs):
+    """
+    Decide whether an existing file must be left as is in update mode. Files
+    unknown to the manifest or edited by the user are never touched.
+    """
+    if not previous:
+      return True
+    if previous['source'] == source and previous['inputs'] == inputs:
+      return True
+    return is_edited(filename, previous['output'])
+
+  def materialize(self, entry, manifest=None, update=False, context=None):
+    """
+    Render or copy a single planned template. Files without jinja extension
+    are cloned as is and never loaded by Jinja. In `update` mode an existing
+    file is rewritten only if its template or replacements changed since it
+    was rendered and the user did not edit it.
+
+    :param context: replacements to render with, jinja globals by default
+    :returns: manifest record, or None if the file was skipped
+    """
+    tmpl_src, filename, is_jinja = entry
+
+    if is_jinja:
+      # Digesting the source and finding the replacements it uses means
+      # reading and parsing it apart from the render, which the bytecode cache
+      # otherwise spares, so only update mode pays for it
+      source_digest = inputs = None
+      if update:
+        source, source_digest = self.get_source(tmpl_src)
+        inputs = self.get_inputs_digest(
+            tmpl_src, source, source_digest, context)
+    else:
+      # Assets are cloned without reading them, only update mode needs to
+      # know whether they changed
+      source_digest = inputs = None
+      if update:
+        source_digest = self.get_asset_digest(tmpl_src)
 
-      # Drop .jenv extension
-      filename = RE_JINJA_EXT.sub('', filename)
+    if update and os.path.exists(filename):
+      previous = manifest.get(filename) if manifest else None
+      if self.is_up_to_date(filename, previous, source_digest, inputs):
+        return None
 
+    if not is_jinja:
+      self.copy_asset(tmpl_src, filename)
+      output = get_file_stamp(filename)
+    else:
+      content = self.jenv.get_template(tmpl_src).render(context or {})
       with codecs.open(filename, 'w', 'utf-8') as out:
-        out.write(tmpl.render())
+        out.write(content)
+      output = get_digest(content)
+
+    return (filename, tmpl_src, source_digest, inputs, output)
+
+#-API---------------------------------------------------------------------------
+
+  def copy_folder(
+      self, src_dir, dst_dir, path_repl=None, jobs=None, update=None):
+    """
+    Render templates found under `src_dir` into `dst_dir`. Destination tree
+    is planned and its folders created first, then files are rendered, on a
+    thread pool if `jobs`(or `crutch_jinja_jobs` property) is above one.
+    Every file is marked before and after as TEMPLATE_RENDER lifecycle phase
+    with its filename, marks come in completion order.
+
+    Rendered files are recorded in the .crutch manifest. With `update`(or
+    `crutch_jinja_update` property) set, existing files are re-rendered if
+    their inputs changed and they were not edited since.
+    """
+    self.enable_bytecode_cache()
+    context = self.mirror_repl_to_jinja_globals()
+
+    if jobs is None:
+      jobs = self.renv.get_prop(PROP_JOBS)
+    if update is None:
+      update = bool(self.renv.get_prop(PROP_UPDATE))
+
+    plan = self.plan_folder(src_dir, dst_dir, path_repl, update)
+    self.make_folders(plan)
+
+    manifest = self.get_manifest()
+    lifecycle = self.renv.lifecycle
+    marks = threading.Lock()
+
+    def materialize(entry):
+      with marks:
+        lifecycle.mark_before(Lifecycle.TEMPLATE_RENDER, entry[1])
+      try:
+        return self.materialize(entry, manifest, update, context)
+      finally:
+        with marks:
+          lifecycle.mark_after(Lifecycle.TEMPLATE_RENDER, entry[1])
+
+    if jobs and int(jobs) > 1 and len(plan) > 1:
+      pool = ThreadPool(min(int(jobs), len(plan)))
+      try:
+        results = pool.map(materialize, plan)
+      finally:
+        pool.close()
+        pool.join()
+    else:
+      results = [materialize(entry) for entry in plan]
+
+    if manifest:
+      for record in results:
+        if record:
+          manifest.record(*record)
+
+    if manifest:
+      manifest.save()
+    self.save_digests()
@@ -0,0 +1,67 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017 Artyom Goncharov
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
+# OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import tempfile
+import os
+
+import jinja2
+
+
+class BundleLoader(jinja2.BaseLoader):
+  """
+  Jinja loader serving templates from a TemplateBundle
+  """
+
+  def __init__(self, bundle):
+    self.bundle = bundle
+
+  def get_source(self, environment, template):
+    if template not in self.bundle:
+      raise jinja2.TemplateNotFound(template)
+    source = self.bundle.read(template).decode('utf-8')
+    return source, None, lambda: True
+
+  def list_templates(self):
+    return sorted(self.bundle.names)
+
+
+class BytecodeCache(jinja2.FileSystemBytecodeCache):
+  """
+  Bytecode cache that never fails a render: an unwritable directory just
+  leaves templates uncached. Files are written atomically since several
+  threads or processes may compile the same template.
+  """
+
+  def dump_bytecode(self, bucket):
+    filename = self._get_cache_filename(bucket)
+    try:
+      handle, temp = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+    except (IOError, OSError):
+      return
+
+    try:
+      with os.fdopen(handle, 'wb') as fout:
+        bucket.write_bytecode(fout)
+      os.rename(temp, filename)
+    except (IOError, OSError):
+      if os.path.exists(temp):
+        os.remove(temp)
@@ -26,6 +26,17 @@ from crutch.core.features.basics import Feature, FeatureMenu
 
 NAME = 'new'
 
+
+def copy_project_templates(renv, jinja_ftr):
+  """
+  Render main templates of the project type into the project directory
+  """
+  jinja_ftr.copy_folder(
+      os.path.join(renv.get_project_type(), 'main'),
+      renv.get_project_directory(),
+      {'ProjectNameRepl': renv.get_project_name()})
+
+
 class FeatureMenuNew(FeatureMenu):
 
   def __init__(self, renv, handler_default=None):
@@ -45,6 +56,11 @@ class FeatureMenuNew(FeatureMenu):
         '-f', '--features', metavar='FEATURE', nargs='*', default='default',
         dest='project_features', help='Select project features')
 
+    default.add_argument(
+        '-j', '--jobs', metavar='JOBS', type=int, default=1,
+        dest='crutch_activation_jobs',
+        help='Set up independent features in parallel(default=1)')
+
 
 class FeatureNew(Feature):
 
@@ -87,12 +103,7 @@ class FeatureNew(Feature):
     # Save user features to config
     renv.set_prop('project_features', flatten_order, mirror_to_config=True)
 
-    psub = {'ProjectNameRepl': renv.get_project_name()}
-
-    self.jinja_ftr.copy_folder(
-        os.path.join(project_type, 'main'),
-        project_directory,
-        psub)
+    copy_project_templates(renv, self.jinja_ftr)
 
     print("Done!")
 
@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017 Artyom Goncharov
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
+# OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Cached directory walks. Creating, renaming or removing an entry changes the
+mtime of its parent directory, so an index keeps mtimes of the directories it
+has seen and walks the tree again only when one of them changes.
+"""
+
+import threading
+import os
+
+
+def get_mtime(path):
+  try:
+    return os.stat(path).st_mtime
+  except OSError:
+    return None
+
+
+class DirectoryIndex(object):
+  """
+  Values collected from directory trees under `roots`. For every directory
+  `collect(root, path, dirs, files)` is called and returns an iterable of
+  values found there.
+  """
+
+  def __init__(self, roots, collect):
+    self.roots = list(roots)
+    self.collect = collect
+    self.stamps = None
+    self.values = list()
+    self.lock = threading.Lock()
+
+  def is_stale(self):
+    if self.stamps is None:
+      return True
+    for path, mtime in self.stamps.items():
+      if get_mtime(path) != mtime:
+        return True
+    return False
+
+  def walk(self, request=None):
+    """
+    Walk the trees, the walk is abandoned if `request` gets cancelled
+
+    :returns: tuple of directory mtimes and values, or None if cancelled
+    """
+    stamps = dict()
+    values = list()
+    for root in self.roots:
+      stack = [root]
+      while stack:
+        if request and request.is_cancelled():
+          return None
+
+        path = stack.pop()
+        # Stat before listing, a change in between makes the index stale
+        stamps[path] = get_mtime(path)
+        try:
+          names = sorted(os.listdir(path))
+        except OSError:
+          continue
+
+        dirs, files = list(), list()
+        for name in names:
+          if os.path.isdir(os.path.join(path, name)):
+            dirs.append(name)
+          else:
+            files.append(name)
+
+        values.extend(self.collect(root, path, dirs, files))
+        stack.extend(
+            os.path.join(path, d) for d in reversed(dirs) \
+            if not os.path.islink(os.path.join(path, d)))
+    return stamps, values
+
+  def get(self, request=None):
+    """
+    :returns: `list` of values, or None if `request` was cancelled
+    """
+    with self.lock:
+      if self.is_stale():
+        walked = self.walk(request)
+        if walked is None:
+          return None
+        self.stamps, self.values = walked
+      return list(self.values)
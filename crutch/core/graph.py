@@ -0,0 +1,116 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017 Artyom Goncharov
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
+# OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Minimal directed graph used to hold feature dependencies. It keeps insertion
+order of nodes and edges so every traversal is deterministic.
+"""
+
+from collections import deque
+
+from crutch.core.exceptions import StopException
+
+
+class DiGraph(object):
+
+  def __init__(self):
+    self.nodes = list()
+    self.preds = dict()
+    self.succs = dict()
+
+  def __contains__(self, node):
+    return node in self.preds
+
+  def __len__(self):
+    return len(self.nodes)
+
+  def __iter__(self):
+    return iter(self.nodes)
+
+  def add_node(self, node):
+    if node in self.preds:
+      return
+    self.nodes.append(node)
+    self.preds[node] = list()
+    self.succs[node] = list()
+
+  def add_edge(self, src, dst):
+    self.add_node(src)
+    self.add_node(dst)
+    if dst not in self.succs[src]:
+      self.succs[src].append(dst)
+      self.preds[dst].append(src)
+
+  def has_edge(self, src, dst):
+    return src in self.succs and dst in self.succs[src]
+
+  def predecessors(self, node):
+    return list(self.preds[node])
+
+  def successors(self, node):
+    return list(self.succs[node])
+
+  def topological_sort(self, nbunch=None, reverse=False):
+    """
+    Kahn's topological sort over the subgraph induced by `nbunch`. No subgraph
+    object is created, edges leading outside of `nbunch` are simply ignored.
+
+    :param nbunch: `iterable` of nodes to sort, the whole graph if `None`.
+      Names unknown to the graph are dropped.
+    :param reverse: If `True` sort as if every edge was reversed, i.e. every
+      node comes before its dependencies.
+    :returns: `list` of nodes
+    """
+    if nbunch is None:
+      subset = set(self.nodes)
+    else:
+      subset = set(n for n in nbunch if n in self.preds)
+
+    incoming, outgoing = self.preds, self.succs
+    if reverse:
+      incoming, outgoing = outgoing, incoming
+
+    nodes = [n for n in self.nodes if n in subset]
+    degree = dict()
+    for node in nodes:
+      degree[node] = len([n for n in incoming[node] if n in subset])
+
+    ready = deque(n for n in nodes if not degree[n])
+    result = list()
+
+    while ready:
+      node = ready.popleft()
+      result.append(node)
+      for nxt in outgoing[node]:
+        if nxt not in subset:
+          continue
+        degree[nxt] -= 1
+        if not degree[nxt]:
+          ready.append(nxt)
+
+    if len(result) != len(nodes):
+      raise StopException(
+          StopException.EFTR,
+          "Dependency graph contains a cycle among {}".format(
+              [n for n in nodes if degree[n]]))
+
+    return result
@@ -21,6 +21,9 @@
 # OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import logging
+
+from timeit import default_timer
+
 LOGGER = logging.getLogger(__name__)
 
 CRUTCH_START = 'crutch-start'
@@ -31,6 +34,7 @@ CATEGORY_SET_UP = 'category-set-up'
 CATEGORY_ACTIVATE = 'category-activate'
 FEATURE_SET_UP = 'feature-set-up'
 FEATURE_ACTIVATE = 'feature-activate'
+TEMPLATE_RENDER = 'template-render'
 CMD_PARSE = 'cmd-parse'
 RUNNER_RUN = 'runner-run'
 FEATURE_DESTRUCTION = 'feature-destruction'
@@ -46,16 +50,38 @@ ORDER_BEFORE = 'order-before'
 ORDER_AFTER = 'order-after'
 
 class Lifecycle(object): #pragma: no cover
+  """
+  Hooks are kept per phase and order, and are compiled into a flat dispatch
+  table of (phase, order) -> tuple of hooks whenever a hook is added, so a
+  mark nobody listens to costs a single dict lookup
+  """
 
   def __init__(self):
     self.hooks = dict()
+    self.table = dict()
+    self.listeners = tuple()
+    self.clock = default_timer
     self.tracing = False
+    self.observed = False
+
+  def update_observed(self):
+    self.observed = self.tracing or bool(self.listeners)
 
   def enable_tracing(self):
     self.tracing = True
+    self.update_observed()
 
   def disable_tracing(self):
     self.tracing = False
+    self.update_observed()
+
+  def add_listener(self, listener):
+    """
+    Listener is called with (phase, order, info, when) on every mark, `when`
+    is the `clock` time a replayed mark happened at, None for the current one
+    """
+    self.listeners += (listener,)
+    self.update_observed()
 
   def add_hook(self, phase, order, hook=ORDER_NONE):
     orders = self.hooks.get(phase, dict())
@@ -63,6 +89,7 @@ class Lifecycle(object): #pragma: no cover
     hooks.append(hook)
     orders[order] = hooks
     self.hooks[phase] = orders
+    self.table[(phase, order)] = tuple(hooks)
 
   def add_hook_before(self, phase, hook):
     self.add_hook(phase, ORDER_BEFORE, hook)
@@ -70,26 +97,29 @@ class Lifecycle(object): #pragma: no cover
   def add_hook_after(self, phase, hook):
     self.add_hook(phase, ORDER_AFTER, hook)
 
-  def mark(self, phase, order=ORDER_NONE, info=None):
-    if self.tracing:
-      LOGGER.info('LIFECYCLE: {} {} {}'.format(order, phase, info))
+  def observe(self, phase, order, info, when=None):
+    if self.tracing and LOGGER.isEnabledFor(logging.INFO):
+      LOGGER.info('LIFECYCLE: %s %s %s', order, phase, info)
 
-    if phase not in self.hooks:
-      return
+    for listener in self.listeners:
+      listener(phase, order, info, when)
 
-    orders = self.hooks[phase]
+  def mark(self, phase, order=ORDER_NONE, info=None, when=None):
+    if self.observed:
+      self.observe(phase, order, info, when)
 
-    if order not in orders:
+    hooks = self.table.get((phase, order))
+    if not hooks:
       return
 
-    for hook in orders[order]:
+    for hook in hooks:
       if info:
         hook(info)
       else:
         hook()
 
-  def mark_before(self, phase, info=None):
-    self.mark(phase, ORDER_BEFORE, info)
+  def mark_before(self, phase, info=None, when=None):
+    self.mark(phase, ORDER_BEFORE, info, when)
 
-  def mark_after(self, phase, info=None):
-    self.mark(phase, ORDER_AFTER, info)
+  def mark_after(self, phase, info=None, when=None):
+    self.mark(phase, ORDER_AFTER, info, when)
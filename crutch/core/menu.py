@@ -28,6 +28,8 @@ menu in CRUTCH related terms and not just parsers and subparsers
 import argparse
 import os
 
+from collections import OrderedDict
+
 import crutch.core.lifecycle as Lifecycle
 
 from crutch.core.exceptions import StopException
@@ -39,6 +41,8 @@ class MenuArgument(object):
   TYPE_OPTIONAL = 1
 
   def __init__(self, short_name=None, long_name=None, **kwargs):
+    # REPL completion source for values that are not known up front
+    self.provider = kwargs.pop('provider', None)
     self.kwargs = kwargs
     self.choices = kwargs.get('choices', None)
     self.default = kwargs.get('default', None)
@@ -73,31 +77,70 @@ class MenuArgument(object):
 
 
 class Menu(object):
+  """
+  Menus only record argument specs, argparse parsers are built on demand and
+  only for the features being parsed
+  """
 
   def __init__(self, renv, *args, **kwargs):
     self.renv = renv
-    self.parser = argparse.ArgumentParser(*args, **kwargs)
-    self.subparsers = self.parser.add_subparsers(title='Features', dest='run_feature')
+    self.args = args
+    self.kwargs = kwargs
     self.arguments = list()
-    self.features = dict()
+    self.features = OrderedDict()
 
   def add_argument(self, short_name=None, long_name=None, **kwargs):
     argument = MenuArgument(short_name, long_name, **kwargs)
-    argument.add_argument(self.parser)
     self.arguments.append(argument)
 
   def add_feature(self, name, desc):
-    feature = MenuFeature(name, self.subparsers.add_parser(name, help=desc))
+    feature = MenuFeature(name, desc)
     self.features[name] = feature
     return feature
 
+  def get_parser(self, features=None):
+    """
+    Build argparse parser for `features`, or for all of them if None
+    """
+    parser = argparse.ArgumentParser(*self.args, **self.kwargs)
+    for argument in self.arguments:
+      argument.add_argument(parser)
+
+    subparsers = parser.add_subparsers(title='Features', dest='run_feature')
+    for name in self.features if features is None else features:
+      self.features[name].build(subparsers)
+
+    return parser
+
   def print_help(self):
-    self.parser.print_help()
+    self.get_parser().print_help()
+
+  def get_action(self, argv):
+    """
+    Find the action `argv` would run without parsing it
+
+    :returns: MenuAction, or None if the feature is not enabled
+    """
+    if not argv or argv[0] not in self.features:
+      return None
+    actions = self.features[argv[0]].actions
+    if not actions:
+      return None
+    name = argv[1] if argv[1:] and argv[1] in actions.get_names() else 'default'
+    return actions.actions.get(name, None)
 
   def parse(self, argv):
     # Prepend with 'default' if necessary
     self.renv.lifecycle.mark(Lifecycle.CMD_PARSE, Lifecycle.ORDER_BEFORE, argv)
     feature = argv[0]
+
+    # Top level help lists every feature
+    if feature in ('-h', '--help'):
+      try:
+        self.get_parser().parse_args(argv)
+      except SystemExit:
+        raise StopException()
+
     if feature not in self.features:
       raise StopException(StopException.EFTR, "Feature '{}' is not enabled".format(feature))
 
@@ -115,7 +158,7 @@ class Menu(object):
     self.renv.lifecycle.mark(Lifecycle.CMD_PARSE, Lifecycle.ORDER_AFTER)
 
     try:
-      opts = vars(self.parser.parse_args(argv))
+      opts = vars(self.get_parser([feature]).parse_args(argv))
     except SystemExit:
       raise StopException(StopException.EPAR, "Parsing failed")
 
@@ -127,13 +170,12 @@ class Menu(object):
 
 class MenuActions(object):
 
-  def __init__(self, name, subparser):
-    self.subparser = subparser
+  def __init__(self, name):
     self.name = name
-    self.actions = dict()
+    self.actions = OrderedDict()
 
-  def add_action(self, name, desc=''):
-    action = MenuAction(name, self.subparser.add_parser(name, help=desc))
+  def add_action(self, name, desc='', interactive=False):
+    action = MenuAction(name, desc, interactive)
     self.actions[name] = action
     action.add_argument(
         '-d', '--directory', dest='project_directory', default='.',
@@ -143,32 +185,48 @@ class MenuActions(object):
   def get_names(self):
     return self.actions.keys()
 
+  def build(self, parser):
+    subparsers = parser.add_subparsers(title='Action', dest='action')
+    for action in self.actions.values():
+      action.build(subparsers)
+
 
 class MenuAction(object):
 
-  def __init__(self, name, parser):
-    self.parser = parser
+  def __init__(self, name, desc='', interactive=False):
     self.name = name
+    self.desc = desc
+    # Action reads from the terminal, e.g. asks for a confirmation
+    self.interactive = interactive
     self.arguments = list()
 
   def add_argument(self, short_name=None, long_name=None, **kwargs):
     argument = MenuArgument(short_name, long_name, **kwargs)
-    argument.add_argument(self.parser)
     self.arguments.append(argument)
 
+  def build(self, subparsers):
+    parser = subparsers.add_parser(self.name, help=self.desc)
+    for argument in self.arguments:
+      argument.add_argument(parser)
+    return parser
+
 
 class MenuFeature(MenuAction):
 
-  def __init__(self, name, parser):
-    super(MenuFeature, self).__init__(name, parser)
+  def __init__(self, name, desc=''):
+    super(MenuFeature, self).__init__(name, desc)
     self.actions = None
 
   def add_actions(self):
-    self.actions = MenuActions(
-        self.name,
-        self.parser.add_subparsers(title='Action', dest='action'))
+    self.actions = MenuActions(self.name)
     return self.actions
 
+  def build(self, subparsers):
+    parser = super(MenuFeature, self).build(subparsers)
+    if self.actions:
+      self.actions.build(parser)
+    return parser
+
 
 def create_crutch_menu(renv):
   """
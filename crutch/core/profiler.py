@@ -0,0 +1,222 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017 Artyom Goncharov
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
+# OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Lifecycle profiler. Every before/after pair of marks becomes a timed span,
+spans of the same thread nest. Results are written to the .crutch directory
+as a Chrome trace(chrome://tracing, Perfetto) and as a flat summary table.
+"""
+
+import threading
+import codecs
+import json
+import sys
+import os
+
+from timeit import default_timer
+
+import crutch.core.lifecycle as Lifecycle
+
+
+MODE_TRACE = 'trace'
+MODE_SUMMARY = 'summary'
+MODE_ALL = 'all'
+
+TRACE_FILE = 'profile.json'
+SUMMARY_FILE = 'profile.txt'
+
+CLOCK_MONOTONIC = 1
+
+
+def get_monotonic_clock():
+  """
+  Python 2 has no time.monotonic, on Linux CLOCK_MONOTONIC is read through
+  libc. Elsewhere default_timer is used.
+  """
+  if not sys.platform.startswith('linux'):
+    return default_timer
+
+  try:
+    import ctypes
+    import ctypes.util
+
+    class Timespec(ctypes.Structure):
+      _fields_ = [('tv_sec', ctypes.c_long), ('tv_nsec', ctypes.c_long)]
+
+    libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+    clock_gettime = libc.clock_gettime
+    clock_gettime.argtypes = [ctypes.c_int, ctypes.POINTER(Timespec)]
+  except (OSError, AttributeError):
+    return default_timer
+
+  def monotonic():
+    spec = Timespec()
+    if clock_gettime(CLOCK_MONOTONIC, ctypes.byref(spec)) != 0:
+      errno = ctypes.get_errno()
+      raise OSError(errno, os.strerror(errno))
+    return spec.tv_sec + spec.tv_nsec * 1e-9
+
+  return monotonic
+
+
+def find_open_entry(stack, phase, info):
+  """
+  Same phase marks may interleave, so an after mark closes the topmost open
+  entry with the same phase and info. Some phases report a result rather than
+  the request, then the topmost entry of the phase is closed.
+  """
+  fallback = None
+  for depth in reversed(range(len(stack))):
+    if stack[depth][0] != phase:
+      continue
+    if stack[depth][1] == info:
+      return depth
+    if fallback is None:
+      fallback = depth
+  return fallback
+
+
+class Span(object):
+
+  def __init__(self, phase, info, tid, start, end, depth):
+    self.phase = phase
+    self.info = info
+    self.tid = tid
+    self.start = start
+    self.end = end
+    self.depth = depth
+
+  def get_duration(self):
+    return self.end - self.start
+
+
+class Profiler(object):
+  """
+  Listens to every lifecycle mark and saves the results upon CRUTCH_STOP
+  """
+
+  def __init__(self, renv, mode=MODE_ALL, clock=None):
+    self.renv = renv
+    self.mode = mode if mode in (MODE_TRACE, MODE_SUMMARY) else MODE_ALL
+    self.clock = clock or get_monotonic_clock()
+    self.origin = self.clock()
+    self.lock = threading.Lock()
+    self.stacks = dict()
+    self.spans = list()
+    self.instants = list()
+
+    # Marks replayed after the fact are timed with the same clock
+    renv.lifecycle.clock = self.clock
+    renv.lifecycle.add_listener(self.mark)
+    renv.lifecycle.add_hook(Lifecycle.CRUTCH_STOP, Lifecycle.ORDER_NONE, self.save)
+
+  def mark(self, phase, order, info, when=None):
+    now = (self.clock() if when is None else when) - self.origin
+    tid = threading.current_thread().ident
+
+    with self.lock:
+      stack = self.stacks.setdefault(tid, list())
+
+      if order == Lifecycle.ORDER_BEFORE:
+        stack.append((phase, info, now))
+        return
+
+      if order == Lifecycle.ORDER_AFTER:
+        depth = find_open_entry(stack, phase, info)
+        if depth is not None:
+          _, begin_info, start = stack.pop(depth)
+          self.spans.append(Span(phase, begin_info, tid, start, now, depth))
+          return
+
+      self.instants.append((phase, info, tid, now))
+
+#-EXPORT------------------------------------------------------------------------
+
+  def get_trace(self):
+    """
+    Chrome trace-event format, timestamps are in microseconds
+    """
+    pid = os.getpid()
+    events = list()
+
+    for span in sorted(self.spans, key=lambda s: (s.start, s.depth)):
+      event = {
+          'name': span.phase,
+          'cat': 'lifecycle',
+          'ph': 'X',
+          'ts': span.start * 1e6,
+          'dur': span.get_duration() * 1e6,
+          'pid': pid,
+          'tid': span.tid}
+      if span.info is not None:
+        event['args'] = {'info': span.info}
+      events.append(event)
+
+    for phase, info, tid, now in self.instants:
+      event = {
+          'name': phase,
+          'cat': 'lifecycle',
+          'ph': 'i',
+          's': 't',
+          'ts': now * 1e6,
+          'pid': pid,
+          'tid': tid}
+      if info is not None:
+        event['args'] = {'info': info}
+      events.append(event)
+
+    return {'traceEvents': events, 'displayTimeUnit': 'ms'}
+
+  def get_summary(self):
+    """
+    Table of phases sorted by total time spent
+    """
+    totals = dict()
+    for span in self.spans:
+      count, total, longest = totals.get(span.phase, (0, 0.0, 0.0))
+      duration = span.get_duration()
+      totals[span.phase] = (count + 1, total + duration, max(longest, duration))
+
+    lines = ['{:<24} {:>6} {:>12} {:>12}'.format(
+        'PHASE', 'COUNT', 'TOTAL(ms)', 'MAX(ms)')]
+    for phase, (count, total, longest) in sorted(
+        totals.items(), key=lambda item: (-item[1][1], item[0])):
+      lines.append('{:<24} {:>6} {:>12.3f} {:>12.3f}'.format(
+          phase, count, total * 1e3, longest * 1e3))
+    return '\n'.join(lines) + '\n'
+
+  def save(self):
+    """
+    Write results into the .crutch directory, nothing is written if there is
+    no such directory
+    """
+    directory = self.renv.get_crutch_directory()
+    if not directory or not os.path.exists(directory):
+      return
+
+    with self.lock:
+      if self.mode in (MODE_TRACE, MODE_ALL):
+        with codecs.open(os.path.join(directory, TRACE_FILE), 'w', 'utf-8') as out:
+          json.dump(self.get_trace(), out, default=repr)
+      if self.mode in (MODE_SUMMARY, MODE_ALL):
+        with codecs.open(os.path.join(directory, SUMMARY_FILE), 'w', 'utf-8') as out:
+          out.write(self.get_summary())
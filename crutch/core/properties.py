@@ -21,17 +21,36 @@
 # OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
 import UserDict
+import tempfile
 import codecs
 import json
 import os
 
 class FlatJSONConfig(UserDict.DictMixin):
+  """
+  FlatJSONConfig exposes nested JSON object as a flat dictionary, where a key
+  is a path to a leaf value joined with `_`. Flat keys are kept in an index
+  updated on every write, so membership tests do not walk the JSON tree.
+
+  Every write bumps the generation counter, flush does nothing unless the
+  generation changed and the serialized content differs from the one last
+  loaded or written. Reading a list or a dict bumps it as well, since it may
+  be changed in place.
+  """
 
-  def __init__(self, filename=None):
+  def __init__(self, filename=None, on_write=None):
     self.filename = filename
     self.data = dict()
+    self.index = set()
+    self.on_write = on_write
+    self.generation = 0
+    self.flushed_generation = None
+    self.flushed_content = None
 
   def set_filename(self, filename):
+    if filename != self.filename:
+      self.flushed_generation = None
+      self.flushed_content = None
     self.filename = filename
 
   def get_next_to_last(self, key, create=False):
@@ -59,6 +78,28 @@ class FlatJSONConfig(UserDict.DictMixin):
 
     return collection
 
+  def notify(self, keys):
+    if self.on_write:
+      for key in keys:
+        self.on_write(key)
+
+  def index_add(self, key, value):
+    if isinstance(value, dict):
+      keys = self.get_flat_keys(value, list(), key)
+    else:
+      keys = [key]
+    self.index.update(keys)
+    self.notify(keys)
+
+  def index_remove(self, key, value):
+    if isinstance(value, dict):
+      prefix = key + '_'
+      keys = [k for k in self.index if k.startswith(prefix)]
+    else:
+      keys = [key]
+    self.index.difference_update(keys)
+    self.notify(keys)
+
   def remove_empty(self, key):
     path = key.split('_')
     curr = self.data
@@ -72,36 +113,151 @@ class FlatJSONConfig(UserDict.DictMixin):
 
   def __getitem__(self, key):
     name, obj = self.get_next_to_last(key)
-    return obj[name]
+    value = obj[name]
+    if isinstance(value, (list, dict)):
+      self.generation += 1
+    return value
 
   def __setitem__(self, key, value):
     name, obj = self.get_next_to_last(key, True)
+    if name in obj:
+      self.index_remove(key, obj[name])
     obj[name] = value
+    self.index_add(key, value)
+    self.generation += 1
 
   def __delitem__(self, key):
     name, obj = self.get_next_to_last(key)
-    del obj[name]
+    value = obj.pop(name)
     self.remove_empty(key)
+    self.index_remove(key, value)
+    self.generation += 1
 
   def __contains__(self, key):
-    return key in self.keys()
+    return key in self.index
+
+  def __iter__(self):
+    return iter(list(self.index))
+
+  def __len__(self):
+    return len(self.index)
 
   def items(self):
-    return [(key, self[key]) for key in self.keys()]
+    return [(key, self[key]) for key in self.index]
 
   def keys(self):
-    return self.get_flat_keys(self.data, list())
+    return list(self.index)
+
+  def reindex(self):
+    previous = self.index
+    self.index = set(self.get_flat_keys(self.data, list()))
+    self.notify(previous | self.index)
 
   def load(self):
     assert self.filename
     if os.path.exists(self.filename):
       with codecs.open(self.filename, 'rU', 'utf-8') as fin:
         self.data = json.load(fin)
+      self.reindex()
+      self.generation += 1
+      self.flushed_generation = self.generation
+      self.flushed_content = self.serialize()
+
+  def serialize(self):
+    return json.dumps(self.data, sort_keys=True)
+
+  def write(self, content):
+    """
+    Write `content` to a temporary file next to the config and rename it over
+    the config, so readers never see a partially written file
+    """
+    directory = os.path.dirname(os.path.abspath(self.filename))
+    fd, temp = tempfile.mkstemp(
+        dir=directory, prefix=os.path.basename(self.filename) + '.')
+
+    try:
+      with os.fdopen(fd, 'w') as fout:
+        fout.write(content)
+        fout.flush()
+        os.fsync(fout.fileno())
+
+      # mkstemp creates owner only files, keep the usual permissions instead
+      if os.path.exists(self.filename):
+        os.chmod(temp, os.stat(self.filename).st_mode & 0o777)
+      else:
+        umask = os.umask(0)
+        os.umask(umask)
+        os.chmod(temp, 0o666 & ~umask)
+
+      os.rename(temp, self.filename)
+    except Exception:
+      if os.path.exists(temp):
+        os.remove(temp)
+      raise
 
   def flush(self):
+    """
+    Write the config to disk if it has changed.
+
+    :returns: `True` if the file was written
+    """
     assert self.filename
-    with codecs.open(self.filename, 'wU', 'utf-8') as fout:
-      json.dump(self.data, fout)
+    exists = os.path.exists(self.filename)
+    if exists and self.generation == self.flushed_generation:
+      return False
+
+    content = self.serialize()
+    if exists and content == self.flushed_content:
+      self.flushed_generation = self.generation
+      return False
+
+    self.write(content)
+    self.flushed_generation = self.generation
+    self.flushed_content = content
+    return True
+
+
+class PropertiesLayer(dict):
+  """
+  Plain dict that reports every written or deleted key to `on_write` callback
+  """
+
+  def __init__(self, on_write):
+    super(PropertiesLayer, self).__init__()
+    self.on_write = on_write
+
+  def __setitem__(self, key, value):
+    super(PropertiesLayer, self).__setitem__(key, value)
+    self.on_write(key)
+
+  def __delitem__(self, key):
+    super(PropertiesLayer, self).__delitem__(key)
+    self.on_write(key)
+
+  def update(self, *args, **kwargs):
+    for key, value in dict(*args, **kwargs).items():
+      self[key] = value
+
+  def setdefault(self, key, value=None):
+    if key not in self:
+      self[key] = value
+    return self[key]
+
+  def pop(self, key, *args):
+    result = super(PropertiesLayer, self).pop(key, *args)
+    self.on_write(key)
+    return result
+
+  def popitem(self):
+    key, value = super(PropertiesLayer, self).popitem()
+    self.on_write(key)
+    return key, value
+
+  def clear(self):
+    keys = self.keys()
+    super(PropertiesLayer, self).clear()
+    for key in keys:
+      self.on_write(key)
 
 
 class Properties(UserDict.DictMixin):
@@ -116,15 +272,31 @@ class Properties(UserDict.DictMixin):
 
   All writes to this object will be done do stage object. Writing to config
   file requires calling explicit methods
+
+  Every key is mapped to the provider that wins for it, the map is updated as
+  writes reach the layers so lookups never scan all the providers
   """
 
+  NAMES = ['stage', 'cli', 'config', 'defaults']
+
   def __init__(self):
-    self.defaults = dict()
-    self.config = FlatJSONConfig()
-    self.cli = dict()
-    self.stage = dict()
+    self.defaults = PropertiesLayer(self.resolve)
+    self.config = FlatJSONConfig(on_write=self.resolve)
+    self.cli = PropertiesLayer(self.resolve)
+    self.stage = PropertiesLayer(self.resolve)
 
     self.providers = [self.stage, self.cli, self.config, self.defaults]
+    self.resolved = dict()
+
+  def resolve(self, key):
+    """
+    Find the provider that wins for `key`
+    """
+    for index, provider in enumerate(self.providers):
+      if key in provider:
+        self.resolved[key] = index
+        return
+    self.resolved.pop(key, None)
 
   def update_cli(self, props):
     self.cli.update(props)
@@ -133,10 +305,10 @@ class Properties(UserDict.DictMixin):
     self.config.set_filename(config)
 
   def __getitem__(self, key):
-    for provider in self.providers:
-      if key in provider:
-        return provider[key]
-    return None
+    index = self.resolved.get(key, None)
+    if index is None:
+      return None
+    return self.providers[index][key]
 
   def __setitem__(self, key, value):
     self.stage[key] = value
@@ -145,13 +317,20 @@ class Properties(UserDict.DictMixin):
     del self.stage[key]
 
   def __contains__(self, key):
-    return key in self.keys()
+    return key in self.resolved
 
   def keys(self):
-    result = list()
-    for provider in self.providers:
-      result += provider.keys()
-    return list(set(result))
+    return self.resolved.keys()
+
+  def get_provider_name(self, key):
+    """
+    Return name of the layer `key` is read from, `None` if there is no such
+    key
+    """
+    index = self.resolved.get(key, None)
+    if index is None:
+      return None
+    return Properties.NAMES[index]
 
   def config_push(self, selected=None):
     properties = selected or self.keys()
@@ -185,5 +364,8 @@ class Properties(UserDict.DictMixin):
     result += 'CLI:' + offset + format_dict(self.cli) + dline
     result += 'Config:' + offset + format_dict(self.config) + dline
     result += 'Defaults:' + offset + format_dict(self.defaults) + dline
+    result += 'Resolved:' + offset + format_dict(
+        {k: '{} ({})'.format(self[k], self.get_provider_name(k)) \
+            for k in self.keys()}) + dline
 
     return result
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017 Artyom Goncharov
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
+# OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Background completion providers. A provider is a callable taking a
+CompletionRequest and yielding completion values; slow ones, e.g. those that
+walk the file system, run on a worker thread so typing is never blocked.
+"""
+
+import threading
+
+
+class CompletionRequest(object):
+  """
+  A single run of a provider, it becomes cancelled as soon as a newer request
+  supersedes it. Providers should check `is_cancelled` while they iterate.
+  """
+
+  def __init__(self, owner, provider, generation):
+    self.owner = owner
+    self.provider = provider
+    self.generation = generation
+
+  def is_cancelled(self):
+    return self.owner.generation != self.generation
+
+
+class ImmediateRequest(object):
+
+  def is_cancelled(self):
+    return False
+
+
+def run_provider(provider, request=None):
+  """
+  Run `provider` to the end, or until the request is cancelled
+
+  :returns: list of values or None if cancelled
+  """
+  request = request or ImmediateRequest()
+  result = list()
+  for value in provider(request):
+    if request.is_cancelled():
+      return None
+    result.append(value)
+  return result
+
+
+class BackgroundCompletions(object):
+  """
+  Runs providers on a single worker thread. Only the latest request is kept,
+  older ones are cancelled. Finished results are cached per provider until
+  `invalidate` is called and are merged in by the next completion pass, the
+  `on_ready` callback tells the prompt to run one.
+  """
+
+  def __init__(self, on_ready=None):
+    self.on_ready = on_ready
+    self.condition = threading.Condition()
+    self.generation = 0
+    self.pending = None
+    self.running = None
+    self.results = dict()
+    self.thread = None
+
+  def get(self, provider):
+    """
+    Return cached values of `provider`, or None and schedule it
+    """
+    with self.condition:
+      if provider in self.results:
+        return self.results[provider]
+
+      # The same provider is already being run for us
+      current = self.pending or self.running
+      if current and current.provider == provider and \
+         not current.is_cancelled():
+        return None
+
+      self.generation += 1
+      self.pending = CompletionRequest(self, provider, self.generation)
+      self.start()
+      self.condition.notify()
+    return None
+
+  def cancel(self):
+    """
+    Cancel any pending or running request
+    """
+    with self.condition:
+      if self.pending or self.running:
+        self.generation += 1
+        self.pending = None
+
+  def invalidate(self, *_):
+    with self.condition:
+      self.generation += 1
+      self.pending = None
+      self.results.clear()
+
+  def start(self):
+    if self.thread:
+      return
+    self.thread = threading.Thread(target=self.run, name='crutch-completions')
+    self.thread.daemon = True
+    self.thread.start()
+
+  def run(self):
+    while True:
+      with self.condition:
+        while not self.pending:
+          self.condition.wait()
+        request = self.running = self.pending
+        self.pending = None
+
+      values = run_provider(request.provider, request)
+
+      with self.condition:
+        self.running = None
+        if values is None or request.is_cancelled():
+          continue
+        self.results[request.provider] = values
+
+      if self.on_ready:
+        self.on_ready()
@@ -20,10 +20,14 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
 # OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-import shlex
-
 from prompt_toolkit.completion import Completer, Completion
 
+import crutch.core.lifecycle as Lifecycle
+
+from crutch.core.repl.background import run_provider
+from crutch.core.repl.index import CompletionIndex
+from crutch.core.repl.tokenizer import Tokenizer
+
 
 class ArgumentsSequence(object):
 
@@ -52,41 +56,51 @@ class ArgumentsSequence(object):
 
 
 class CrutchCompleter(Completer):
-
-  def __init__(self, renv):
+  """
+  Completions are looked up in a CompletionIndex of the menu, which is rebuilt
+  lazily after features are activated or deactivated. Values of arguments with
+  a provider come from BackgroundCompletions if given, otherwise the provider
+  is run in place.
+  """
+
+  def __init__(self, renv, tokenizer=None, background=None):
     super(CrutchCompleter, self).__init__()
     self.renv = renv
     self.menu = renv.menu
+    self.tokenizer = tokenizer or Tokenizer()
+    self.background = background
+    self.index = None
+    self.provided = False
 
-  def get_feature_completions(self, partial):
-    result = []
-    features = self.menu.features.keys()
+    renv.lifecycle.add_hook_after(Lifecycle.FEATURE_CREATION, self.invalidate)
+    renv.lifecycle.add_hook_after(Lifecycle.FEATURE_DESTRUCTION, self.invalidate)
 
-    if partial:
-      for name in features:
-        if name.find(partial) == 0:
-          result.append(Completion(name, -len(partial)))
-    else:
-      for name in features:
-        result.append(Completion(name))
+  def invalidate(self, *_):
+    self.index = None
+    if self.background:
+      self.background.invalidate()
 
-    return result
+  def get_index(self):
+    if self.index is None:
+      self.index = CompletionIndex(self.menu)
+    return self.index
+
+  def get_feature_completions(self, partial):
+    return [Completion(name, -len(partial) if partial else 0)
+            for name in self.get_index().features.find(partial)]
 
   def get_actions_completions(self, words, partial):
     result = []
-    feature = words[0]
-    menu = self.menu.features.get(feature, None)
+    feature = self.get_index().get_feature(words[0])
 
-    if not menu:
+    if not feature:
       return result
 
-    for action in menu.actions.actions.keys():
-      if partial and action.find(partial) != 0:
-        continue
-
-      if action == 'default':
-        continue
+    # Options of the default action
+    if partial and partial[0] == '-':
+      return self.get_arguments_completions(words + ['default'], partial)
 
+    for action in feature.actions.find(partial):
       result.append(Completion(
           text=action,
           start_position=-len(partial) if partial else 0))
@@ -97,7 +111,31 @@ class CrutchCompleter(Completer):
 
     return result
 
-  def get_nargs_q_completions(self, optional, sequence, partial):
+  def get_provided_values(self, provider):
+    self.provided = True
+    if self.background:
+      return self.background.get(provider) or []
+    return run_provider(provider)
+
+  def find_values(self, action, argument, partial):
+    """
+    Return static choices and provided values starting with `partial`
+    """
+    result = action.find_choices(argument, partial)
+    if not argument.provider:
+      return result
+
+    result = list(result)
+    for value in self.get_provided_values(argument.provider):
+      if value.startswith(partial or '') and value not in result:
+        result.append(value)
+    return result
+
+  def choices_to_completions(self, choices, partial):
+    start = -len(partial) if partial else 0
+    return [Completion(text=choice, start_position=start) for choice in choices]
+
+  def get_nargs_q_completions(self, action, optional, sequence, partial):
     result = []
     need_more = True
     choices = optional.choices or []
@@ -108,41 +146,34 @@ class CrutchCompleter(Completer):
         sequence.pop()
         need_more = False
 
-      # If partial matches one of the choices we yield the completion and return for now
-      elif partial:
-        maybe = [c for c in choices if c.find(partial) == 0]
-        if maybe:
-          for choice in maybe:
-            result.append(Completion(text=choice, start_position=-len(partial)))
-
-      # Otherwise we just list the choices if any
+      # Otherwise we list the choices matching partial if any
       else:
-        for choice in choices:
-          result.append(Completion(text=choice, start_position=0))
+        result.extend(self.choices_to_completions(
+            self.find_values(action, optional, partial), partial))
 
     else:
       if not sequence.empty() and not sequence.top_is_opt():
         sequence.pop()
         need_more = False
+      elif sequence.empty():
+        result.extend(self.choices_to_completions(
+            self.find_values(action, optional, partial), partial))
 
     return result, need_more
 
-  def get_nargs_s_completions(self, optional, sequence, partial):
+  def get_nargs_s_completions(self, action, optional, sequence, partial):
     result = []
     need_more = True
-    choices = optional.choices or []
-    if choices:
+    if optional.choices or optional.provider:
+      used = set()
       while not sequence.empty() and not sequence.top_is_opt():
-        value = sequence.pop()
-        choices.remove(value)
+        used.add(sequence.pop())
 
       if sequence.empty():
-        if partial:
-          for choice in [c for c in choices if c.find(partial) == 0]:
-            result.append(Completion(text=choice, start_position=-len(partial)))
-        else:
-          for choice in choices:
-            result.append(Completion(text=choice, start_position=0))
+        result.extend(self.choices_to_completions(
+            [c for c in self.find_values(action, optional, partial)
+             if c not in used],
+            partial))
     else:
       while not sequence.empty() and not sequence.top_is_opt():
         sequence.pop()
@@ -150,61 +181,45 @@ class CrutchCompleter(Completer):
 
     return result, need_more
 
-  def optionals_to_completions(self, optionals, partial):
+  def optionals_to_completions(self, action, optionals, partial):
     result = []
-    if partial:
-      for optional in optionals.values():
-        if optional.short_name.find(partial) != 0 or optional.long_name.find(partial) != 0:
-          continue
-        result.append(Completion(
-            text=optional.long_name,
-            display='/'.join([optional.short_name, optional.long_name]),
-            start_position=-len(partial)))
-    else:
-      for optional in optionals.values():
-        result.append(Completion(
-            text=optional.long_name,
-            display='/'.join([optional.short_name, optional.long_name])))
+    for optional in action.find_optionals(partial):
+      if optional.short_name not in optionals:
+        continue
+      result.append(Completion(
+          text=optional.long_name,
+          display='/'.join([optional.short_name, optional.long_name]),
+          start_position=-len(partial) if partial else 0))
 
     return result
 
-  def positionals_to_completions(self, positionals, partial):
+  def positionals_to_completions(self, action, positionals, partial):
     result = []
-
-    if partial:
-      for positional in positionals:
-        for choice in [c for c in (positional.choices or []) if c.find(partial) == 0]:
-          result.append(Completion(choice, start_position=-len(partial)))
-    else:
-      for positional in positionals:
-        for choice in (positional.choices or []):
-          result.append(Completion(choice))
-
+    for positional in positionals:
+      result.extend(self.choices_to_completions(
+          self.find_values(action, positional, partial), partial))
     return result
 
   def get_arguments_completions(self, words, partial):
     result = []
     sequence = ArgumentsSequence(list(reversed(words)))
-    feature = sequence.pop()
-    menu = self.menu.features.get(feature, None)
+    feature = self.get_index().get_feature(sequence.pop())
 
-    if not menu:
+    if not feature:
       return result
 
-    actions = menu.actions.actions
-
-    action = sequence.top()
-    if action in actions.keys():
+    action = None
+    if not sequence.empty():
+      action = feature.get_action(sequence.top())
+    if action:
       sequence.pop()
-    elif 'default' in actions.keys():
-      action = 'default'
     else:
+      action = feature.get_action('default')
+    if not action:
       return result
 
-    arguments = actions.get(action).arguments
-    positionals = [a for a in arguments if a.is_positional()]
-    optionals = {a.short_name:a for a in arguments if a.is_optional()}
-    long_to_short = {a.long_name:a.short_name for a in arguments if a.is_optional()}
+    positionals = list(action.positionals)
+    optionals = dict(action.optionals)
 
     # Before we provide completions we need to remove already used options
     while not sequence.empty():
@@ -213,7 +228,7 @@ class CrutchCompleter(Completer):
         if sequence.top_is_opt_short():
           optional = optionals.get(sequence.pop(), None)
         else:
-          short = long_to_short.get(sequence.pop(), None)
+          short = action.long_to_short.get(sequence.pop(), None)
           if short:
             optional = optionals.get(short, None)
 
@@ -225,10 +240,12 @@ class CrutchCompleter(Completer):
 
         need_more = False
         if optional.nargs == '?':
-          completions, need_more = self.get_nargs_q_completions(optional, sequence, partial)
+          completions, need_more = self.get_nargs_q_completions(
+              action, optional, sequence, partial)
           result.extend(completions)
         elif optional.nargs == '*' or optional.nargs == '+':
-          completions, need_more = self.get_nargs_s_completions(optional, sequence, partial)
+          completions, need_more = self.get_nargs_s_completions(
+              action, optional, sequence, partial)
           result.extend(completions)
         else:
           for _ in range(optional.nargs):
@@ -236,6 +253,9 @@ class CrutchCompleter(Completer):
               need_more = True
               break
             sequence.pop()
+          if need_more and sequence.empty():
+            result.extend(self.choices_to_completions(
+                self.find_values(action, optional, partial), partial))
 
         if need_more and sequence.empty():
           return result
@@ -244,18 +264,28 @@ class CrutchCompleter(Completer):
         choice = sequence.pop()
         for positional in positionals:
           choices = positional.choices or []
-          if choice in choices and (positional.nargs == '?' or positional.nargs == 1):
+          if (choice in choices or positional.provider) and \
+             (positional.nargs == '?' or positional.nargs == 1):
             positionals.remove(positional)
             break
 
-    result.extend(self.optionals_to_completions(optionals, partial))
-    result.extend(self.positionals_to_completions(positionals, partial))
+    result.extend(self.optionals_to_completions(action, optionals, partial))
+    result.extend(self.positionals_to_completions(action, positionals, partial))
 
     return result
 
   def get_completions(self, document, _):
+    self.provided = False
+    for completion in self.get_menu_completions(document):
+      yield completion
+
+    # Nothing here needs the running provider anymore
+    if self.background and not self.provided:
+      self.background.cancel()
+
+  def get_menu_completions(self, document):
     partial = document.get_word_before_cursor(WORD=True)
-    words = shlex.split(document.text)
+    words = [t.value for t in self.tokenizer.tokenize(document.text_before_cursor)]
     length = len(words)
 
     if partial:
@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017 Artyom Goncharov
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
+# OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Completion index of the CRUTCH menu. Features, actions, options and choices
+are put into prefix tries once, so completing a word costs the length of the
+word rather than the size of the menu.
+"""
+
+
+class PrefixTrie(object):
+  """
+  Character trie mapping words to values. Every node keeps the words of its
+  subtree in insertion order.
+  """
+
+  def __init__(self):
+    self.root = (dict(), list())
+    self.values = dict()
+
+  def add(self, word, value=None):
+    if word in self.values:
+      self.values[word] = value
+      return
+
+    self.values[word] = value
+    children, words = self.root
+    words.append(word)
+    for char in word:
+      if char not in children:
+        children[char] = (dict(), list())
+      children, words = children[char]
+      words.append(word)
+
+  def __contains__(self, word):
+    return word in self.values
+
+  def get(self, word, default=None):
+    return self.values.get(word, default)
+
+  def find(self, prefix=''):
+    """
+    Return words starting with `prefix`
+    """
+    node = self.root
+    for char in prefix or '':
+      node = node[0].get(char, None)
+      if node is None:
+        return list()
+    return node[1]
+
+
+class ActionIndex(object):
+
+  def __init__(self, action):
+    self.arguments = action.arguments
+    self.positionals = [a for a in self.arguments if a.is_positional()]
+    self.optionals = dict()
+    self.long_to_short = dict()
+    self.options = PrefixTrie()
+    self.choices = dict()
+
+    for argument in self.arguments:
+      if argument.is_optional():
+        self.optionals[argument.short_name] = argument
+        self.long_to_short[argument.long_name] = argument.short_name
+        self.options.add(argument.short_name, argument)
+        self.options.add(argument.long_name, argument)
+
+      choices = PrefixTrie()
+      for choice in argument.choices or []:
+        choices.add(choice)
+      self.choices[id(argument)] = choices
+
+  def find_choices(self, argument, prefix):
+    return self.choices[id(argument)].find(prefix)
+
+  def find_optionals(self, prefix):
+    """
+    Return optionals whose short or long name starts with `prefix`
+    """
+    result = list()
+    for name in self.options.find(prefix):
+      optional = self.options.get(name)
+      if optional not in result:
+        result.append(optional)
+    return result
+
+
+class FeatureIndex(object):
+
+  def __init__(self, feature):
+    self.actions = PrefixTrie()
+    self.indexes = dict()
+
+    actions = feature.actions.actions if feature.actions else dict()
+    for name, action in actions.items():
+      self.indexes[name] = ActionIndex(action)
+      if name != 'default':
+        self.actions.add(name)
+
+  def get_action(self, name):
+    return self.indexes.get(name, None)
+
+
+class CompletionIndex(object):
+
+  def __init__(self, menu):
+    self.features = PrefixTrie()
+    for name, feature in menu.features.items():
+      self.features.add(name, FeatureIndex(feature))
+
+  def get_feature(self, name):
+    return self.features.get(name)
@@ -20,17 +20,23 @@
 # TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
 # OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
 
-from pygments.lexer import RegexLexer
-from pygments.lexer import words
+from collections import OrderedDict
+import weakref
+
 from pygments.token import Keyword, Text, Name
 
+from prompt_toolkit.layout.lexers import Lexer
+
 from crutch.core.runtime import RuntimeEnvironment
 
+LINE_CACHE_SIZE = 256
+TABLES = weakref.WeakKeyDictionary()
+
 def get_menu(): #pragma: no cover
   return RuntimeEnvironment.get_default().menu
 
-def create_actions_list(): #pragma: no cover
-  menu = RuntimeEnvironment.get_default().menu
+def create_actions_list(menu=None):
+  menu = menu or get_menu()
 
   features = menu.features.keys()
   actions = list()
@@ -56,22 +62,95 @@ def create_actions_list(): #pragma: no cover
         if argument.choices:
           names.extend(argument.choices)
 
-  return tuple(set(features)), tuple(set(actions)), tuple(set(options)), tuple(set(names))
-
-def create_lexer(): #pragma: no cover
-  class CommandLexer(RegexLexer):
-    name = 'Command Line'
-    aliases = ['cli']
-    filenames = []
-
-    crutch_features, crutch_actions, crutch_options, crutch_names = create_actions_list()
-
-    tokens = {
-        'root': [
-            (words(crutch_features, prefix=r'^', suffix=r'\b'), Keyword.Namespace),
-            (words(crutch_actions, prefix=r'', suffix=r'\b'), Keyword.Namespace),
-            (words(crutch_options, prefix=r'', suffix=r'\b'), Keyword.Type),
-            (words(crutch_names, prefix=r'', suffix=r'\b'), Name),
-            (r'.*\n', Text)]
-        }
-  return CommandLexer
+  return frozenset(features), frozenset(actions), frozenset(options), frozenset(names)
+
+def get_actions_list(menu=None):
+  """
+  Cached create_actions_list, the tables are built once per set of active
+  features and shared by every lexer of the menu
+  """
+  menu = menu or get_menu()
+  tables = TABLES.setdefault(menu, dict())
+  key = frozenset(menu.features.keys())
+  if key not in tables:
+    tables[key] = create_actions_list(menu)
+  return tables[key]
+
+
+class CommandLexer(Lexer):
+  """
+  Highlights words produced by the shared REPL tokenizer: feature names only
+  at the start of the line, then actions, options and argument choices.
+  Highlighted lines are cached by text until the active features change.
+  """
+
+  def __init__(self, tokenizer, menu=None, cache_size=LINE_CACHE_SIZE):
+    self.tokenizer = tokenizer
+    self.menu = menu
+    self.tables = None
+    self.cache = OrderedDict()
+    self.cache_size = cache_size
+
+  def update_tables(self):
+    tables = get_actions_list(self.menu)
+    if tables is not self.tables:
+      self.tables = tables
+      self.cache.clear()
+
+  def get_token_type(self, index, value):
+    features, actions, options, names = self.tables
+    if index == 0 and value in features:
+      return Keyword.Namespace
+    if value in actions:
+      return Keyword.Namespace
+    if value in options:
+      return Keyword.Type
+    if value in names:
+      return Name
+    return Text
+
+  def get_fragments(self, text):
+    fragments = list()
+    position = 0
+    for index, token in enumerate(self.tokenizer.tokenize(text)):
+      if token.start > position:
+        fragments.append((Text, text[position:token.start]))
+      fragments.append((
+          self.get_token_type(index, token.value),
+          text[token.start:token.end]))
+      position = token.end
+    if position < len(text):
+      fragments.append((Text, text[position:]))
+    return fragments
+
+  def get_lines(self, text):
+    lines = [[]]
+    for token_type, chunk in self.get_fragments(text):
+      parts = chunk.split('\n')
+      for number, part in enumerate(parts):
+        if number:
+          lines.append([])
+        if part:
+          lines[-1].append((token_type, part))
+    return lines
+
+  def get_cached_lines(self, text):
+    self.update_tables()
+    lines = self.cache.pop(text, None)
+    if lines is None:
+      lines = self.get_lines(text)
+      if len(self.cache) >= self.cache_size:
+        self.cache.popitem(last=False)
+    self.cache[text] = lines
+    return lines
+
+  def lex_document(self, cli, document):
+    lines = self.get_cached_lines(document.text)
+
+    def get_line(lineno):
+      return lines[lineno] if lineno < len(lines) else []
+
+    return get_line
+
+def create_lexer(tokenizer, menu=None):
+  return CommandLexer(tokenizer, menu)
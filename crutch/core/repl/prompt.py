@@ -22,8 +22,6 @@
 
 from __future__ import unicode_literals
 
-import shlex
-
 from pygments.token import Token
 
 from prompt_toolkit import AbortAction, Application, CommandLineInterface
@@ -36,7 +34,10 @@ from crutch.core.repl.lexer import create_lexer
 from crutch.core.repl.toolbar import create_toolbar_handler
 from crutch.core.repl.keys import get_key_manager
 from crutch.core.repl.style import style_factory
+from crutch.core.repl.background import BackgroundCompletions
 from crutch.core.repl.completer import CrutchCompleter
+from crutch.core.repl.tokenizer import Tokenizer
+from crutch.core.exceptions import StopException
 
 class Prompt(object): #pragma: no cover
 
@@ -44,6 +45,8 @@ class Prompt(object): #pragma: no cover
     self.renv = renv
     self.is_long = True
     self.cli = None
+    self.tokenizer = Tokenizer()
+    self.background = BackgroundCompletions(self.on_completions_ready)
 
   def initialize(self):
     history = InMemoryHistory()
@@ -51,12 +54,12 @@ class Prompt(object): #pragma: no cover
 
     layout = create_prompt_layout(
         get_prompt_tokens=self.get_prompt_tokens,
-        lexer=create_lexer(),
+        lexer=create_lexer(self.tokenizer),
         get_bottom_toolbar_tokens=toolbar_handler)
 
     buf = Buffer(
         history=history,
-        completer=CrutchCompleter(self.renv),
+        completer=CrutchCompleter(self.renv, self.tokenizer, self.background),
         complete_while_typing=Always(),
         accept_action=AcceptAction.RETURN_DOCUMENT)
 
@@ -77,6 +80,23 @@ class Prompt(object): #pragma: no cover
 
     self.cli = CommandLineInterface(application=application, eventloop=eventloop)
 
+  def on_completions_ready(self):
+    # Called from the worker thread, the CLI must be touched from its loop
+    cli = self.cli
+    if cli:
+      cli.eventloop.call_from_executor(lambda: self.refresh_completions(cli))
+
+  def refresh_completions(self, cli):
+    buf = cli.current_buffer
+    state = buf.complete_state
+
+    # Do not pull the menu from under the user while they pick a completion
+    if state and state.complete_index is not None:
+      return
+
+    buf.complete_state = None
+    cli.start_completion()
+
   def get_prompt_tokens(self, _):
     return [(Token.Pound, ' Y '), (Token.Text, ' ')]
 
@@ -90,5 +110,10 @@ class Prompt(object): #pragma: no cover
     if reinitialize:
       self.initialize()
     assert self.cli
+    # Previous command might have changed what providers list
+    self.background.invalidate()
     document = self.cli.run(True)
-    return shlex.split(document.text)
+    try:
+      return self.tokenizer.split(document.text)
+    except ValueError as error:
+      raise StopException(StopException.EPAR, str(error))
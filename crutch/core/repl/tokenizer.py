@@ -0,0 +1,133 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017 Artyom Goncharov
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
+# OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+"""
+Shell-like tokenizer shared by the REPL completer, lexer and the final argv.
+It follows shlex.split in POSIX mode, but remembers the tokens of the last
+text and re-tokenizes only from the first changed character.
+"""
+
+import threading
+import os
+
+WHITESPACE = ' \t\r\n'
+QUOTES = '\'"'
+ESCAPE = '\\'
+ESCAPED_IN_QUOTES = '"\\'
+
+
+class Token(object):
+
+  def __init__(self, start, end, value, closed=True):
+    self.start = start
+    self.end = end
+    self.value = value
+    self.closed = closed
+
+  def __repr__(self):
+    return '[Token {} {}:{}]'.format(self.value, self.start, self.end)
+
+
+def scan(text, position=0):
+  """
+  Tokenize `text` starting at `position` which must not be inside a token
+  """
+  tokens = list()
+  length = len(text)
+  index = position
+
+  while index < length:
+    if text[index] in WHITESPACE:
+      index += 1
+      continue
+
+    start = index
+    value = list()
+    quote = None
+    closed = True
+
+    while index < length:
+      char = text[index]
+      if quote:
+        if char == quote:
+          quote = None
+        elif char == ESCAPE and quote == '"' and index + 1 < length \
+            and text[index + 1] in ESCAPED_IN_QUOTES:
+          index += 1
+          value.append(text[index])
+        else:
+          value.append(char)
+      elif char in WHITESPACE:
+        break
+      elif char in QUOTES:
+        quote = char
+      elif char == ESCAPE:
+        if index + 1 < length:
+          index += 1
+          value.append(text[index])
+        else:
+          closed = False
+      else:
+        value.append(char)
+      index += 1
+
+    tokens.append(Token(start, index, ''.join(value), closed and not quote))
+
+  return tokens
+
+
+class Tokenizer(object):
+
+  def __init__(self):
+    self.text = ''
+    self.tokens = list()
+    self.lock = threading.Lock()
+
+  def tokenize(self, text):
+    """
+    :returns: `list` of Token objects, it must not be modified
+    """
+    with self.lock:
+      if text == self.text:
+        return self.tokens
+
+      # A token followed by an unchanged separator cannot change
+      common = len(os.path.commonprefix([self.text, text]))
+      kept = list()
+      for token in self.tokens:
+        if token.end >= common:
+          break
+        kept.append(token)
+
+      position = kept[-1].end if kept else 0
+      self.tokens = kept + scan(text, position)
+      self.text = text
+      return self.tokens
+
+  def split(self, text):
+    """
+    Same as shlex.split, raises ValueError on unterminated quote or escape
+    """
+    tokens = self.tokenize(text)
+    if tokens and not tokens[-1].closed:
+      raise ValueError('No closing quotation')
+    return [t.value for t in tokens]
@@ -24,30 +24,43 @@ import UserDict
 import os
 
 
-class GenerativeReplacementsProvider(UserDict.DictMixin):
+class ReplacementsProvider(UserDict.DictMixin):
   """
-  This class must be subclassed and method `generate` overridden to fill data
-  with new replacements
+  Dict-like replacements provider that counts writes made through it, the
+  count lets Replacements skip providers that did not change since the last
+  fetch
   """
 
   def __init__(self, data=None):
     self.data = data or dict()
+    self.version = 0
 
   def __getitem__(self, key):
     return self.data[key]
 
   def __setitem__(self, key, value):
     self.data[key] = value
+    self.version += 1
 
   def __delitem__(self, key):
     del self.data[key]
+    self.version += 1
 
   def __contains__(self, key):
-    return key in self.data[key]
+    return key in self.data
 
   def keys(self):
     return self.data.keys()
 
+
+class GenerativeReplacementsProvider(ReplacementsProvider):
+  """
+  This class must be subclassed and method `generate` overridden to fill data
+  with new replacements. `generate` must either assign a new dict to `data`
+  or write through the provider itself, returning the very same untouched
+  `data` object tells Replacements nothing has changed.
+  """
+
   def generate(self):
     return self.data
 
@@ -62,7 +75,8 @@ class Replacements(UserDict.DictMixin):
       condition, e.g: feature activation
 
   Before calling any data on a object of this class you must call fetch()
-  first to retrieve all the data from providers
+  first to retrieve all the data from providers. Only providers that changed
+  since the previous fetch are merged again.
   """
 
   def __init__(self):
@@ -70,6 +84,8 @@ class Replacements(UserDict.DictMixin):
     self.generators = dict()
     self.providers = dict()
     self.data = dict()
+    self.owners = dict()
+    self.merged = dict()
 
   def __getitem__(self, key):
     return self.data[key]
@@ -81,13 +97,21 @@ class Replacements(UserDict.DictMixin):
     raise Exception("You cannot delete a key from Replacements directly")
 
   def __contains__(self, key):
-    return key in self.keys()
+    return key in self.data
 
   def keys(self):
     return self.data.keys()
 
   def add_provider(self, label, provider=None):
-    provider = provider if provider is not None else dict()
+    """
+    Add replacements provider. Plain dicts are wrapped into
+    ReplacementsProvider, use the returned object to modify replacements.
+    """
+    if provider is None:
+      provider = ReplacementsProvider()
+    elif not isinstance(provider, ReplacementsProvider):
+      provider = ReplacementsProvider(provider)
+
     self.providers[label] = provider
     if isinstance(provider, GenerativeReplacementsProvider):
       self.generators[label] = provider
@@ -95,22 +119,61 @@ class Replacements(UserDict.DictMixin):
       self.static[label] = provider
     return provider
 
+  def is_merged(self, label, provider):
+    """
+    Check whether the provider data is the same as it was during the last
+    merge
+    """
+    merged = self.merged.get(label, None)
+    if merged is None:
+      return False
+
+    data, version, snapshot = merged
+    if data is provider.data and version == provider.version:
+      return True
+
+    return snapshot == provider.data
+
+  def unmerge(self, label):
+    """
+    Drop keys owned by `label`
+    """
+    if label not in self.merged:
+      return
+    for key in self.merged.pop(label)[2]:
+      del self.data[key]
+      del self.owners[key]
+
+  def merge(self, label, provider):
+    for key in provider.keys():
+      if key in self.owners:
+        raise Exception("Key conflict {}".format(key))
+
+    for key in provider.keys():
+      self.data[key] = provider[key]
+      self.owners[key] = label
+
+    self.merged[label] = (provider.data, provider.version, dict(provider.data))
+
   def fetch(self):
-    self.data = dict()
-    for provider in self.static.values():
-      for key in provider:
-        if key in self.data:
-          raise Exception("Key conflict {}".format(key))
-        else:
-          self.data[key] = provider[key]
-
-    for provider in self.generators.values():
+    changed = list()
+
+    for label, provider in self.static.items():
+      if not self.is_merged(label, provider):
+        changed.append((label, provider))
+
+    for label, provider in self.generators.items():
       provider.generate()
-      for key in provider:
-        if key in self.data:
-          raise Exception("Key conflict {}".format(key))
-        else:
-          self.data[key] = provider[key]
+      if not self.is_merged(label, provider):
+        changed.append((label, provider))
+
+    # Old keys go first, so a key moved from one provider to another is not
+    # reported as a conflict
+    for label, _ in changed:
+      self.unmerge(label)
+
+    for label, provider in changed:
+      self.merge(label, provider)
 
   def get_print_info(self):
     self.fetch()
@@ -41,10 +41,18 @@ class Runner(object):
   def __init__(self, renv):
     self.renv = renv
     self.default_run_feature = None
+    self.on_demand_features = set()
 
   def register_default_run_feature(self, name):
     self.default_run_feature = name
 
+  def register_on_demand_feature(self, name):
+    """
+    Feature that is not among the project features, but is activated once a
+    command invokes it
+    """
+    self.on_demand_features.add(name)
+
   def register_feature_category_class(self, *args, **kwargs):
     self.renv.feature_ctrl.register_feature_category_class(*args, **kwargs)
 
@@ -57,6 +65,13 @@ class Runner(object):
   def deactivate_features(self):
     return self.renv.feature_ctrl.deactivate()
 
+  def activate_on_demand(self, argv):
+    if not argv or argv[0] not in self.on_demand_features:
+      return
+    ctrl = self.renv.feature_ctrl
+    if argv[0] not in ctrl.get_active_features_names():
+      ctrl.activate_features([argv[0]])
+
   def invoke_feature(self, name):
     self.renv.feature_ctrl.invoke(name)
 
@@ -80,3 +95,4 @@ class RunnerDefault(Runner):
         features=['jinja', 'feature', 'new'],
         defaults=['feature'],
         mono=False)
+    self.register_on_demand_feature('feature')
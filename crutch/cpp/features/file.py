@@ -23,9 +23,8 @@
 import shutil
 import os
 
-import prompter
-
 from crutch.core.exceptions import StopException
+from crutch.core.fsindex import DirectoryIndex
 from crutch.core.features.basics import create_simple_feature_category
 from crutch.core.features.basics import Feature, FeatureMenu
 
@@ -39,7 +38,8 @@ EXT_HPP = '.hpp'
 
 class FeatureMenuCppFileManager(FeatureMenu):
 
-  def __init__(self, renv, handler_add=None, handler_remove=None):
+  def __init__(
+      self, renv, handler_add=None, handler_remove=None, provider_groups=None):
     super(FeatureMenuCppFileManager, self).__init__(
         renv, NAME, 'C++ File Manager')
 
@@ -52,15 +52,17 @@ class FeatureMenuCppFileManager(FeatureMenu):
     remove = self.add_action(
         'remove',
         'Remove C++ file group',
-        handler_remove)
+        handler_remove,
+        interactive=True)
     remove.add_argument(
         dest=OPT_GROUP,
         metavar='GROUP',
+        provider=provider_groups,
         help='C++ file group to remove')
 
 
 FeatureCategoryCppFile = create_simple_feature_category(
-    FeatureMenuCppFileManager)
+    FeatureMenuCppFileManager, provider_groups='provide_groups')
 
 
 class FileGroup(object):
@@ -126,14 +128,49 @@ class FileGroup(object):
     return not self.__eq__(other)
 
 
+def collect_groups(root, path, _, files):
+  ext = EXT_HPP if os.path.basename(os.path.dirname(root)) == PATH_INCLUDE \
+      else EXT_CPP
+  for filename in files:
+    name, file_ext = os.path.splitext(filename)
+    if file_ext == ext:
+      name = os.path.relpath(os.path.join(path, name), root)
+      yield name.replace(os.path.sep, '/')
+
+
 class FeatureCppFileManager(Feature):
 
   def __init__(self, renv):
     self.jinja_ftr = renv.feature_ctrl.get_active_feature('jinja')
+    self.group_index = None
     super(FeatureCppFileManager, self).__init__(renv, FeatureMenuCppFileManager(
         renv,
         handler_add=self.action_add,
-        handler_remove=self.action_remove))
+        handler_remove=self.action_remove,
+        provider_groups=self.provide_groups))
+
+#-SUPPORT-----------------------------------------------------------------------
+
+  def get_group_index(self):
+    renv = self.renv
+    project_name = renv.get_project_name()
+    project_directory = renv.get_project_directory()
+    roots = [
+        os.path.join(project_directory, PATH_INCLUDE, project_name),
+        os.path.join(project_directory, PATH_SRC, project_name)]
+    if not self.group_index or self.group_index.roots != roots:
+      self.group_index = DirectoryIndex(roots, collect_groups)
+    return self.group_index
+
+  def get_group_names(self, request=None):
+    """
+    :returns: sorted names of existing file groups, or None if cancelled
+    """
+    names = self.get_group_index().get(request)
+    return sorted(set(names)) if names is not None else None
+
+  def provide_groups(self, request):
+    return self.get_group_names(request) or []
 
 #-API---------------------------------------------------------------------------
 
@@ -170,6 +207,7 @@ class FeatureCppFileManager(Feature):
           StopException.EFS,
           "File group '{}' does not exist".format(group.name))
 
+    import prompter
     if not prompter.yesno("Are you sure?"):
       raise StopException("Nothing was removed")
 
@@ -24,9 +24,8 @@ import subprocess
 import shutil
 import os
 
-import prompter
-
 from crutch.core.exceptions import StopException
+from crutch.core.fsindex import DirectoryIndex
 from crutch.core.features.basics import create_simple_feature_category
 from crutch.core.features.basics import Feature, FeatureMenu
 
@@ -44,7 +43,8 @@ CONFIG_CHOICES = [CONFIG_DEBUG, CONFIG_RELEASE]
 class FeatureMenuCppTest(FeatureMenu):
 
   def __init__(self, renv, name=NAME,\
-      handler_default=None, handler_add=None, handler_remove=None):
+      handler_default=None, handler_add=None, handler_remove=None,
+      provider_tests=None):
     super(FeatureMenuCppTest, self).__init__(renv, name, 'Test C++ Project')
     default = self.add_default_action('Test project', handler_default)
     default.add_argument(
@@ -53,16 +53,21 @@ class FeatureMenuCppTest(FeatureMenu):
         help='Select project config')
     default.add_argument(
         '-t', '--tests', dest=OPT_TESTS, metavar='TESTS',
-        default=[], nargs='*', help='Select tests to run')
+        default=[], nargs='*', provider=provider_tests,
+        help='Select tests to run')
 
     add = self.add_action('add', 'Add test', handler_add)
     add.add_argument(dest=OPT_TEST, metavar='TEST', help='Test name')
 
-    remove = self.add_action('remove', 'Remove test', handler_remove)
-    remove.add_argument(dest=OPT_TEST, metavar='TEST', help='Test name')
+    remove = self.add_action(
+        'remove', 'Remove test', handler_remove, interactive=True)
+    remove.add_argument(
+        dest=OPT_TEST, metavar='TEST', provider=provider_tests,
+        help='Test name')
 
 
-FeatureCategoryCppTest = create_simple_feature_category(FeatureMenuCppTest)
+FeatureCategoryCppTest = create_simple_feature_category(
+    FeatureMenuCppTest, provider_tests='provide_tests')
 
 
 class Test(object):
@@ -88,10 +93,16 @@ class Test(object):
     return not self.__eq__(other)
 
 
+def collect_tests(root, path, _, files):
+  if path != root and 'CMakeLists.txt' in files and 'test.cpp' in files:
+    yield Test(os.path.relpath(path, root).replace(os.path.sep, '/'))
+
+
 class FeatureCppTest(Feature):
 
   def __init__(self, renv, name):
     self.name = name
+    self.test_index = None
     self.build_ftr = renv.feature_ctrl.get_mono_feature(Build.NAME)
     self.jinja_ftr = renv.feature_ctrl.get_active_feature('jinja')
     super(FeatureCppTest, self).__init__(renv, FeatureMenuCppTest(
@@ -99,7 +110,8 @@ class FeatureCppTest(Feature):
         name,
         handler_default=self.action_default,
         handler_add=self.action_add,
-        handler_remove=self.action_remove))
+        handler_remove=self.action_remove,
+        provider_tests=self.provide_tests))
 
   def set_up(self):
     psub = {'ProjectNameRepl': self.renv.get_project_name()}
@@ -129,14 +141,17 @@ class FeatureCppTest(Feature):
   def get_test_bin_dir(self):
     return os.path.join(self.get_build_directory(), 'test')
 
-  def get_tests(self):
-    result = list()
+  def get_test_index(self):
     src_dir = self.get_test_src_dir()
-    for path, _, _ in os.walk(src_dir):
-      if os.path.exists(os.path.join(path, 'CMakeLists.txt')) and \
-         os.path.exists(os.path.join(path, 'test.cpp')):
-        result.append(Test(path.replace(src_dir + os.path.sep, '')))
-    return result
+    if not self.test_index or self.test_index.roots != [src_dir]:
+      self.test_index = DirectoryIndex([src_dir], collect_tests)
+    return self.test_index
+
+  def get_tests(self, request=None):
+    return self.get_test_index().get(request)
+
+  def provide_tests(self, request):
+    return [t.name for t in self.get_tests(request) or []]
 
   def run_test(self, test):
     renv = self.renv
@@ -223,6 +238,7 @@ class FeatureCppTest(Feature):
           StopException.EFS,
           "'{}' does not exist".format(test.name))
 
+    import prompter
     if not prompter.yesno("Do you really want remove this test?"):
       raise StopException("Nothing was removed")
 
@@ -1,8 +1,43 @@
 """Setup for crutch."""
 
+import imp
 import io
+import os
 
+from distutils.cmd import Command
 from setuptools import setup
+from setuptools.command.build_py import build_py
+
+
+class PackTemplates(Command):
+  """Pack templates folder into templates.zip bundle of the built package."""
+
+  description = 'pack templates into a single bundle'
+  user_options = [('build-lib=', 'd', 'directory to put the bundle into')]
+
+  def initialize_options(self):
+    self.build_lib = None
+
+  def finalize_options(self):
+    # The bundle goes to the build directory only, a bundle left in the source
+    # tree would hide template edits
+    self.set_undefined_options('build_py', ('build_lib', 'build_lib'))
+
+  def run(self):
+    bundle = imp.load_source(
+        'crutch_bundle', os.path.join('crutch', 'core', 'bundle.py'))
+    output = os.path.join(self.build_lib, 'crutch', 'templates.zip')
+    self.mkpath(os.path.dirname(output))
+    names = bundle.pack('templates', output)
+    print('packed {} templates'.format(len(names)))
+
+
+class BuildPy(build_py):
+  """Pack templates after building."""
+
+  def run(self):
+    build_py.run(self)
+    self.run_command('pack_templates')
 
 
 def requirements():
@@ -35,6 +70,7 @@ setup(
     package_data={
         'templates': ['*.*'],
     },
+    cmdclass={'pack_templates': PackTemplates, 'build_py': BuildPy},
     classifiers=[
         'Development Status :: 3 - Alpha',
         'Environment :: Web Environment',
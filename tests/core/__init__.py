@@ -4,15 +4,45 @@ def get_suite():
   loader = unittest.defaultTestLoader
   suite = unittest.TestSuite()
 
+  import tests.core.daemon as daemon
+  suite.addTest(loader.loadTestsFromModule(daemon))
+
   import tests.core.features.ctrl as ctrl
   suite.addTest(loader.loadTestsFromModule(ctrl))
 
+  import tests.core.features.jinja as jinja
+  suite.addTest(loader.loadTestsFromModule(jinja))
+
+  import tests.core.fsindex as fsindex
+  suite.addTest(loader.loadTestsFromModule(fsindex))
+
+  import tests.core.graph as graph
+  suite.addTest(loader.loadTestsFromModule(graph))
+
+  import tests.core.lifecycle as lifecycle
+  suite.addTest(loader.loadTestsFromModule(lifecycle))
+
+  import tests.core.profiler as profiler
+  suite.addTest(loader.loadTestsFromModule(profiler))
+
   import tests.core.properties as properties
   suite.addTest(loader.loadTestsFromModule(properties))
 
   import tests.core.replacements as replacements
   suite.addTest(loader.loadTestsFromModule(replacements))
 
+  import tests.core.repl.background as background
+  suite.addTest(loader.loadTestsFromModule(background))
+
+  import tests.core.repl.completer as completer
+  suite.addTest(loader.loadTestsFromModule(completer))
+
+  import tests.core.repl.lexer as lexer
+  suite.addTest(loader.loadTestsFromModule(lexer))
+
+  import tests.core.repl.tokenizer as tokenizer
+  suite.addTest(loader.loadTestsFromModule(tokenizer))
+
   import tests.core.menu as menu
   suite.addTest(loader.loadTestsFromModule(menu))
 
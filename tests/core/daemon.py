@@ -0,0 +1,154 @@
+import threading
+import unittest
+import tempfile
+import shutil
+import os
+
+from StringIO import StringIO
+
+import crutch.core.daemon as Daemon
+
+from crutch.core.exceptions import StopException
+
+
+class FakeRenv(object):
+
+  def __init__(self, config):
+    self.config = config
+
+  def get_crutch_config(self):
+    return self.config
+
+
+class FakeDriver(object):
+
+  prepared = 0
+  shutdowns = 0
+
+  def __init__(self):
+    self.renv = None
+
+  def prepare(self, directory):
+    FakeDriver.prepared += 1
+    self.renv = FakeRenv(os.path.join(directory, '.crutch.json'))
+    return 'runner'
+
+  def is_interactive(self, argv):
+    return argv[1:2] == ['remove']
+
+  def execute(self, runner, argv):
+    if argv == ['stop']:
+      raise StopException(StopException.EFTR, 'stopped')
+    print('{} {}'.format(runner, ' '.join(argv)))
+    os.system('echo child')
+    return len(argv), None
+
+  def shutdown(self):
+    FakeDriver.shutdowns += 1
+
+
+class DaemonTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = os.path.realpath(tempfile.mkdtemp())
+    self.cwd = os.getcwd()
+    self.config = os.path.join(self.dir, '.crutch.json')
+    with open(self.config, 'w') as out:
+      out.write('{}')
+
+    FakeDriver.prepared = 0
+    FakeDriver.shutdowns = 0
+    self.daemon = Daemon.Daemon(FakeDriver, os.path.join(self.dir, 'sock'))
+    self.server = self.daemon.create_server()
+    self.thread = threading.Thread(target=self.server.serve_forever)
+    self.thread.start()
+
+  def tearDown(self):
+    self.server.shutdown()
+    self.server.server_close()
+    self.thread.join()
+    os.chdir(self.cwd)
+    shutil.rmtree(self.dir)
+
+  def forward(self, argv):
+    output = StringIO()
+    os.chdir(self.dir)
+    code = Daemon.forward(argv, self.daemon.path, output)
+    os.chdir(self.cwd)
+    return code, output.getvalue()
+
+  def test_forward(self):
+    self.assertEqual(
+        self.forward(['build', 'debug']), (2, 'runner build debug\nchild\n'))
+    self.assertEqual(self.forward(['build']), (1, 'runner build\nchild\n'))
+    self.assertEqual(FakeDriver.prepared, 1)
+
+  def test_stale_config(self):
+    self.forward(['build'])
+    with open(self.config, 'w') as out:
+      out.write('{"project": {}}')
+    self.forward(['build'])
+    self.assertEqual(FakeDriver.prepared, 2)
+
+  def test_stop_drops_runtime(self):
+    self.assertEqual(self.forward(['stop']), (StopException.EFTR, 'stopped\n'))
+    self.assertEqual(FakeDriver.shutdowns, 1)
+    self.forward(['build'])
+    self.assertEqual(FakeDriver.prepared, 2)
+
+  def test_local_commands(self):
+    self.assertIsNone(Daemon.forward(['new', 'cpp'], self.daemon.path))
+    self.assertIsNone(
+        Daemon.forward(['build'], os.path.join(self.dir, 'missing')))
+
+  def test_interactive_actions(self):
+    # Daemon refuses them and the client runs them itself
+    self.assertEqual(self.forward(['test', 'remove', 'alpha']), (None, ''))
+    self.assertEqual(FakeDriver.prepared, 1)
+    self.assertFalse(Daemon.is_local(['test', 'remove', 'alpha']))
+    self.assertFalse(Daemon.is_local([]))
+
+  def test_foreign_socket(self):
+    getuid = os.getuid
+    os.getuid = lambda: getuid() + 1
+    try:
+      self.assertIsNone(Daemon.forward(['build'], self.daemon.path))
+      with self.assertRaises(RuntimeError):
+        Daemon.Daemon(FakeDriver, self.daemon.path).create_server()
+    finally:
+      os.getuid = getuid
+    self.assertTrue(os.path.exists(self.daemon.path))
+
+
+class SocketPathTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.environ = dict(os.environ)
+    self.tempdir = tempfile.tempdir
+    tempfile.tempdir = self.dir
+    for name in (Daemon.ENV_SOCKET, 'XDG_RUNTIME_DIR'):
+      os.environ.pop(name, None)
+
+  def tearDown(self):
+    os.environ.clear()
+    os.environ.update(self.environ)
+    tempfile.tempdir = self.tempdir
+    shutil.rmtree(self.dir)
+
+  def test_private_directory(self):
+    directory = os.path.join(self.dir, 'crutch-{}'.format(os.getuid()))
+    self.assertEqual(
+        Daemon.get_socket_path(), os.path.join(directory, 'crutch.sock'))
+    self.assertEqual(os.stat(directory).st_mode & 0o777, 0o700)
+
+    # Folder others can get into is not used
+    os.chmod(directory, 0o755)
+    self.assertIsNone(Daemon.get_socket_path())
+
+  def test_environment(self):
+    os.environ['XDG_RUNTIME_DIR'] = self.dir
+    self.assertEqual(
+        Daemon.get_socket_path(), os.path.join(self.dir, 'crutch.sock'))
+    os.environ[Daemon.ENV_SOCKET] = os.path.join(self.dir, 'other')
+    self.assertEqual(Daemon.get_socket_path(), os.path.join(self.dir, 'other'))
@@ -1,11 +1,17 @@
 import logging
 import unittest
 
+from multiprocessing.pool import ThreadPool
+
 from mock import MagicMock
 
+import crutch.core.lifecycle as Lifecycle
+
+from crutch.core.exceptions import StopException
 from crutch.core.runner import Runner, Runners
 from crutch.core.runtime import RuntimeEnvironment
 from crutch.core.features.basics import Feature, FeatureCategory
+from crutch.core.features.ctrl import FeatureCtrlReplProvider
 
 def create_runtime(runner):
   return RuntimeEnvironment(Runners({'runner': runner}))
@@ -42,6 +48,44 @@ class FeatureCtrlReplProviderTest(unittest.TestCase):
     self.assertTrue(renv.repl.get('project_feature_category_echo'))
     self.assertTrue(renv.repl.get('project_feature_foxtrot'))
 
+  def test_category_deactivated(self):
+    class RunnerBlah(Runner):
+      def __init__(self, renv):
+        super(RunnerBlah, self).__init__(renv)
+        self.register_feature_class('foxtrot', Feature)
+        self.register_feature_category_class('echo', features=['foxtrot'])
+
+    renv = create_runtime(RunnerBlah)
+    renv.create_runner('runner')
+    ctrl = renv.feature_ctrl
+    ctrl.activate_features(['foxtrot'])
+
+    # Listing generated while the category is being deactivated is not served
+    # once it is gone
+    provider = FeatureCtrlReplProvider(renv)
+    renv.lifecycle.add_hook_after(
+        Lifecycle.CATEGORY_DEACTIVATE, lambda _: provider.generate())
+    ctrl.deactivate_features(['foxtrot'])
+
+    self.assertNotIn('project_feature_category_echo', provider.generate())
+
+
+class FeatureCategoryProviderTest(unittest.TestCase):
+
+  def test_chained(self):
+    class FeatureBlah(Feature):
+      def provide_names(self, _):
+        return ['alpha', 'bravo']
+
+    renv = create_runtime(Runner)
+    category = FeatureCategory(renv, {'blah': FeatureBlah, 'plain': Feature})
+    provider = category.get_provider('provide_names')
+    self.assertEqual(list(provider(None)), [])
+
+    category.activate_feature('blah')
+    category.activate_feature('plain')
+    self.assertEqual(list(provider(None)), ['alpha', 'bravo'])
+
 
 class FeatureCtrlTestCircularDependencies(unittest.TestCase):
 
@@ -151,6 +195,103 @@ class FeatureCtrlTestNames(unittest.TestCase):
     ctrl.deactivate_features(['oscar'])
 
 
+class FeatureCtrlTestDependencyIndex(unittest.TestCase):
+
+  def setUp(self):
+    class RunnerBlah(Runner):
+      def __init__(self, renv):
+        super(RunnerBlah, self).__init__(renv)
+        self.register_feature_class('delta', Feature)
+        self.register_feature_class('charlie', Feature, requires=['delta'])
+        self.register_feature_class('bravo', Feature, requires=['charlie'])
+        self.register_feature_category_class(
+            'alpha',
+            features=['bravo', 'charlie', 'delta'],
+            defaults=['bravo'])
+        self.register_feature_class('foxtrot', Feature, requires=['alpha'])
+        self.register_feature_category_class('echo', features=['foxtrot'])
+
+    self.renv = create_runtime(RunnerBlah)
+    self.renv.create_runner('runner')
+    self.ctrl = self.renv.feature_ctrl
+
+  def test_dependency_closure(self):
+    closure = self.ctrl.get_features_dependency_closure(['bravo'])
+    self.assertEqual(closure, set(['bravo', 'charlie', 'delta']))
+
+    closure = self.ctrl.get_features_dependency_closure(['foxtrot'])
+    self.assertEqual(closure, set(['foxtrot', 'alpha']))
+
+  def test_registration_invalidates_index(self):
+    self.ctrl.get_features_dependency_closure(['bravo'])
+    self.assertIsNotNone(self.ctrl.ancestors)
+
+    self.ctrl.register_feature_class('golf', Feature, requires=['foxtrot'])
+    self.assertIsNone(self.ctrl.ancestors)
+
+    closure = self.ctrl.get_features_dependency_closure(['golf'])
+    self.assertEqual(closure, set(['golf', 'foxtrot', 'alpha']))
+
+
+class FeatureCtrlTestPlanCache(unittest.TestCase):
+
+  def setUp(self):
+    class RunnerBlah(Runner):
+      def __init__(self, renv):
+        super(RunnerBlah, self).__init__(renv)
+        self.register_feature_class('charlie', Feature)
+        self.register_feature_class('bravo', Feature, requires=['charlie'])
+        self.register_feature_category_class(
+            'alpha', features=['bravo', 'charlie'], mono=False)
+        self.register_feature_class('foxtrot', Feature)
+        self.register_feature_category_class('echo', features=['foxtrot'])
+
+    self.renv = create_runtime(RunnerBlah)
+    self.renv.create_runner('runner')
+    self.ctrl = self.renv.feature_ctrl
+    self.cache = self.ctrl.plan_cache
+
+  def test_same_request_hits(self):
+    first = self.ctrl.get_activation_order(['bravo'])
+    self.assertEqual((self.cache.hits, self.cache.misses), (0, 1))
+
+    second = self.ctrl.get_activation_order(['bravo'])
+    self.assertEqual((self.cache.hits, self.cache.misses), (1, 1))
+    self.assertEqual(first, second)
+
+  def test_plans_are_copies(self):
+    total_order, _ = self.ctrl.get_activation_order(['bravo'])
+    total_order.append('foxtrot')
+    total_order, _ = self.ctrl.get_activation_order(['bravo'])
+    self.assertEqual(['charlie', 'bravo'], total_order)
+
+  def test_active_state_changes_key(self):
+    self.ctrl.get_deactivation_order('all')
+    self.ctrl.activate_features(['bravo'])
+    total_order, _ = self.ctrl.get_deactivation_order('all')
+    self.assertEqual(['bravo', 'charlie'], total_order)
+    self.assertEqual(self.cache.hits, 0)
+
+  def test_registration_drops_plans(self):
+    self.ctrl.get_activation_order(['foxtrot'])
+    self.ctrl.register_feature_class('golf', Feature)
+    self.ctrl.get_activation_order(['foxtrot'])
+    self.assertEqual(self.cache.hits, 0)
+
+  def test_bounded(self):
+    self.cache.size = 2
+    self.ctrl.get_activation_order(['bravo'])
+    self.ctrl.get_activation_order(['charlie'])
+    self.ctrl.get_activation_order(['bravo'])
+    self.ctrl.get_activation_order(['foxtrot'])
+    self.assertEqual(len(self.cache.plans), 2)
+
+    # 'charlie' was the least recently used plan
+    self.ctrl.get_activation_order(['bravo'])
+    self.ctrl.get_activation_order(['charlie'])
+    self.assertEqual((self.cache.hits, self.cache.misses), (2, 4))
+
+
 class FeatureCtrlTestMono(unittest.TestCase):
 
   def setUp(self):
@@ -648,6 +789,89 @@ class FeatureCtrlTestFtrCatLifecycle(unittest.TestCase):
     bravo.deactivate.assert_called_once()
     bravo.tear_down.assert_called_once()
 
+class FeatureCtrlTestParallelActivation(unittest.TestCase):
+
+  def setUp(self):
+    class RunnerBlah(Runner):
+      def __init__(self, renv):
+        super(RunnerBlah, self).__init__(renv)
+        self.register_feature_class('bravo', create_feature)
+        self.register_feature_class('charlie', create_feature)
+        self.register_feature_category_class(
+            'alpha', features=['bravo', 'charlie'],
+            defaults=['bravo', 'charlie'], mono=False)
+        self.register_feature_class('foxtrot', create_feature, requires=['alpha'])
+        self.register_feature_class('golf', create_feature)
+        self.register_feature_category_class(
+            'echo', features=['foxtrot', 'golf'], mono=False)
+
+    self.renv = create_runtime(RunnerBlah)
+    self.renv.create_runner('runner')
+    self.ctrl = self.renv.feature_ctrl
+
+  def test_activation_levels(self):
+    total_order, _ = self.ctrl.get_activation_order(['foxtrot', 'golf'])
+    levels = self.ctrl.get_activation_levels(total_order)
+
+    self.assertEqual(len(levels), 2)
+    self.assertEqual(sorted(levels[0]), ['bravo', 'charlie', 'golf'])
+    self.assertEqual(levels[1], ['foxtrot'])
+
+  def test_parallel_activation(self):
+    marks = list()
+    lifecycle = self.renv.lifecycle
+    for phase in [Lifecycle.FEATURE_SET_UP, Lifecycle.FEATURE_ACTIVATE]:
+      for order in [Lifecycle.ORDER_BEFORE, Lifecycle.ORDER_AFTER]:
+        lifecycle.add_hook(
+            phase, order,
+            lambda name, phase=phase, order=order: marks.append(
+                (phase, order, name)))
+
+    total_order, _ = self.ctrl.activate_features(
+        ['foxtrot', 'golf'], set_up=True, jobs=4)
+
+    for name in total_order:
+      feature = self.ctrl.get_active_feature(name)
+      feature.set_up.assert_called_once()
+      feature.activate.assert_called_once()
+
+    # Every feature is marked around its own call, level by level in total
+    # order regardless of completion order
+    expected = list()
+    for level in self.ctrl.get_activation_levels(total_order):
+      for phase in [Lifecycle.FEATURE_SET_UP, Lifecycle.FEATURE_ACTIVATE]:
+        for name in level:
+          expected.append((phase, Lifecycle.ORDER_BEFORE, name))
+          expected.append((phase, Lifecycle.ORDER_AFTER, name))
+    self.assertEqual(marks, expected)
+
+
+  def test_phase_failure(self):
+    class Broken(object):
+      def set_up(self):
+        raise StopException(StopException.EFTR, 'broken')
+
+    class Working(object):
+      def set_up(self):
+        pass
+
+    marks = list()
+    self.renv.lifecycle.add_hook_after(Lifecycle.FEATURE_SET_UP, marks.append)
+
+    pool = ThreadPool(2)
+    try:
+      with self.assertRaises(StopException):
+        self.ctrl.run_features_phase(
+            pool, Lifecycle.FEATURE_SET_UP,
+            [('broken', Broken()), ('working', Working())], 'set_up')
+    finally:
+      pool.close()
+      pool.join()
+
+    # Every feature is marked before the failure is raised
+    self.assertEqual(marks, ['broken', 'working'])
+
+
 class FeatureCtrlTestAPI(unittest.TestCase):
 
   @unittest.expectedFailure
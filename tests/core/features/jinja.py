@@ -0,0 +1,444 @@
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+import jinja2
+
+import crutch.core.lifecycle as Lifecycle
+
+from crutch.core.runtime import RuntimeEnvironment
+from crutch.core.bundle import TemplateBundle, pack
+from crutch.core.features.jinja import FeatureJinja, TemplateCatalog
+from crutch.core.features.loader import BundleLoader
+from crutch.core.features.jinja import PathRewriter, clone_file, get_path_rewriter
+from crutch.core.features.jinja import CATALOGS, get_file_stamp
+from crutch.core.features.jinja import REWRITERS, REWRITERS_SIZE
+
+
+def write_file(path, content):
+  folder = os.path.dirname(path)
+  if not os.path.exists(folder):
+    os.makedirs(folder)
+  with open(path, 'w') as out:
+    out.write(content)
+
+
+def read_file(path):
+  with open(path) as fin:
+    return fin.read()
+
+
+class TemplateCatalogTest(unittest.TestCase):
+
+  def setUp(self):
+    self.catalog = TemplateCatalog([
+        'cpp/main/src/main.cpp.jinja',
+        'cpp/main/LICENSE',
+        'cpp/features/build/CMakeLists.txt.jinja',
+        'cpp/features/buildx/CMakeLists.txt.jinja'])
+
+  def test_subtree(self):
+    self.assertEqual(
+        self.catalog.list_templates('cpp/main'),
+        ['cpp/main/LICENSE', 'cpp/main/src/main.cpp.jinja'])
+
+  def test_subtree_is_path_prefix(self):
+    self.assertEqual(
+        self.catalog.list_templates('cpp/features/build/'),
+        ['cpp/features/build/CMakeLists.txt.jinja'])
+
+  def test_unknown_subtree(self):
+    self.assertEqual(self.catalog.list_templates('cpp/other'), [])
+    self.assertEqual(self.catalog.list_templates('cpp/main/LICENSE/x'), [])
+
+  def test_all(self):
+    self.assertEqual(len(self.catalog.list_templates()), 4)
+
+
+class PathRewriterTest(unittest.TestCase):
+
+  def test_literal(self):
+    rewriter = PathRewriter({'NameRepl': 'blah', 'Name': 'x', 'Group': 'a\\b'})
+    self.assertIsNotNone(rewriter.regex)
+    self.assertEqual(
+        rewriter.rewrite('/NameRepl/Group/Name.h'), '/blah/a\\b/x.h')
+
+  def test_regex(self):
+    rewriter = PathRewriter({r'\.cpp$': '.cc'})
+    self.assertIsNone(rewriter.regex)
+    self.assertEqual(rewriter.rewrite('/main.cpp'), '/main.cc')
+
+  def test_shared(self):
+    self.assertIsNone(get_path_rewriter(None))
+    self.assertIs(
+        get_path_rewriter({'NameRepl': 'blah'}),
+        get_path_rewriter({'NameRepl': 'blah'}))
+
+  def test_bounded(self):
+    first = get_path_rewriter({'NameRepl': 'first'})
+    for index in range(REWRITERS_SIZE):
+      get_path_rewriter({'NameRepl': str(index)})
+    self.assertEqual(len(REWRITERS), REWRITERS_SIZE)
+    self.assertIsNot(get_path_rewriter({'NameRepl': 'first'}), first)
+
+
+class FeatureJinjaCopyFolderTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.templates = os.path.join(self.dir, 'templates')
+    self.dst = os.path.join(self.dir, 'dst')
+
+    for index in range(8):
+      write_file(
+          os.path.join(self.templates, 'main', 'NameRepl', 'file{}.txt.jinja'
+                       .format(index)),
+          '{{ test_name }} ' + str(index))
+    write_file(os.path.join(self.templates, 'main', 'LICENSE'), 'license')
+    self.blob = ''.join(chr(c) for c in range(256)) * 16
+    write_file(os.path.join(self.templates, 'main', 'blob.bin'), self.blob)
+
+    self.renv = RuntimeEnvironment(None)
+    self.renv.set_prop('test_name', 'blah', mirror_to_repl=True)
+    self.renv.set_prop('crutch_jinja_bytecode', os.path.join(self.dir, 'bc'))
+
+    self.jinja = FeatureJinja(self.renv)
+    self.jinja.bundle = None
+    self.jinja.templates = self.templates
+    self.jinja.jenv = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(self.templates))
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def check_destination(self):
+    self.assertEqual(read_file(os.path.join(self.dst, 'LICENSE')), 'license')
+    self.assertEqual(read_file(os.path.join(self.dst, 'blob.bin')), self.blob)
+    for index in range(8):
+      self.assertEqual(
+          read_file(os.path.join(self.dst, 'blah', 'file{}.txt'.format(index))),
+          'blah {}'.format(index))
+
+  def test_copy_folder(self):
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'})
+    self.check_destination()
+
+  def test_copy_folder_parallel(self):
+    marks = list()
+    lifecycle = self.renv.lifecycle
+    for order in [Lifecycle.ORDER_BEFORE, Lifecycle.ORDER_AFTER]:
+      lifecycle.add_hook(
+          Lifecycle.TEMPLATE_RENDER, order,
+          lambda name, order=order: marks.append((order, name)))
+
+    plan = self.jinja.plan_folder('main', self.dst, {'NameRepl': 'blah'})
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'}, jobs=4)
+    self.check_destination()
+
+    # Every file is marked before and after its own render
+    self.assertEqual(len(marks), 2 * len(plan))
+    for _, filename, _ in plan:
+      self.assertLess(
+          marks.index((Lifecycle.ORDER_BEFORE, filename)),
+          marks.index((Lifecycle.ORDER_AFTER, filename)))
+
+  def test_clone_file(self):
+    src = os.path.join(self.templates, 'main', 'LICENSE')
+    dst = os.path.join(self.dir, 'LICENSE')
+    write_file(dst, 'stale')
+
+    clone_file(src, dst)
+    self.assertEqual(read_file(dst), 'license')
+    self.assertNotEqual(os.stat(src).st_ino, os.stat(dst).st_ino)
+
+    # Writable sources are copied, edits would write through a hard link
+    clone_file(src, dst, link=True)
+    self.assertNotEqual(os.stat(src).st_ino, os.stat(dst).st_ino)
+
+    os.chmod(src, 0o444)
+    clone_file(src, dst, link=True)
+    self.assertEqual(os.stat(src).st_ino, os.stat(dst).st_ino)
+
+    # Replacing a linked file must not write through to the template
+    os.remove(src)
+    write_file(src, 'other')
+    clone_file(src, dst)
+    self.assertEqual(read_file(dst), 'other')
+
+  def test_existing_files_are_kept(self):
+    write_file(os.path.join(self.dst, 'LICENSE'), 'mine')
+    write_file(os.path.join(self.dst, 'blah', 'file0.txt'), 'mine')
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'})
+
+    # Plain files are kept, templates are rendered again
+    self.assertEqual(read_file(os.path.join(self.dst, 'LICENSE')), 'mine')
+    self.assertEqual(
+        read_file(os.path.join(self.dst, 'blah', 'file0.txt')), 'blah 0')
+
+
+class FeatureJinjaBytecodeTest(FeatureJinjaCopyFolderTest):
+
+  def setUp(self):
+    super(FeatureJinjaBytecodeTest, self).setUp()
+    self.renv.set_prop('crutch_version', '0.3.0')
+    self.bytecode = os.path.join(self.dir, 'bc', '0.3.0')
+
+  def create_jinja(self):
+    jinja = FeatureJinja(self.renv)
+    jinja.bundle = None
+    jinja.templates = self.templates
+    jinja.jenv = jinja2.Environment(
+        loader=jinja2.FileSystemLoader(self.templates))
+    return jinja
+
+  def test_directory(self):
+    self.assertEqual(self.jinja.get_bytecode_directory(), self.bytecode)
+
+    self.renv.del_prop('crutch_jinja_bytecode')
+    previous = os.environ.get('XDG_CACHE_HOME')
+    os.environ['XDG_CACHE_HOME'] = self.dir
+    try:
+      self.assertEqual(
+          self.jinja.get_bytecode_directory(),
+          os.path.join(self.dir, 'crutch', 'jinja', '0.3.0'))
+    finally:
+      if previous is None:
+        del os.environ['XDG_CACHE_HOME']
+      else:
+        os.environ['XDG_CACHE_HOME'] = previous
+
+  def test_reused(self):
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'})
+    cached = [f for f in os.listdir(self.bytecode) if f.endswith('.cache')]
+    self.assertEqual(len(cached), 8)
+
+    # Another environment loads compiled templates instead of compiling them
+    def compile_template(*_):
+      raise AssertionError('template was compiled')
+
+    jinja = self.create_jinja()
+    jinja.jenv.compile = compile_template
+    shutil.rmtree(self.dst)
+    jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'})
+    self.check_destination()
+
+  def test_unwritable(self):
+    # Directory cannot be created under a file
+    write_file(os.path.join(self.dir, 'file'), '')
+    self.renv.set_prop('crutch_jinja_bytecode', os.path.join(self.dir, 'file'))
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'})
+    self.check_destination()
+    self.assertIsNone(self.jinja.jenv.bytecode_cache)
+
+    # Directory disappears after the cache is attached
+    self.renv.set_prop('crutch_jinja_bytecode', os.path.join(self.dir, 'bc'))
+    jinja = self.create_jinja()
+    jinja.enable_bytecode_cache()
+    shutil.rmtree(self.bytecode)
+    shutil.rmtree(self.dst)
+    jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'})
+    self.check_destination()
+
+
+class FeatureJinjaDigestsTest(FeatureJinjaBytecodeTest):
+
+  def setUp(self):
+    super(FeatureJinjaDigestsTest, self).setUp()
+    self.digests = os.path.join(self.bytecode, 'digests.json')
+    self.license = os.path.join(self.templates, 'main', 'LICENSE')
+
+  def test_no_manifest(self):
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'})
+    self.check_destination()
+    self.assertFalse(os.path.exists(self.digests))
+
+  def test_cached(self):
+    self.jinja.enable_bytecode_cache()
+    self.assertEqual(len(self.jinja.get_asset_digest('main/LICENSE')), 40)
+    self.jinja.save_digests()
+    self.assertTrue(os.path.exists(self.digests))
+
+    # Another process takes the digest from the cache
+    jinja = self.create_jinja()
+    with open(self.digests) as fin:
+      cached = json.load(fin)[self.license][3]
+    cached = cached[::-1]
+    with open(self.digests, 'w') as fout:
+      json.dump({self.license: self.stat_key() + [cached]}, fout)
+    self.assertEqual(jinja.get_asset_digest('main/LICENSE'), cached)
+
+    # Changed asset is read again
+    write_file(self.license, 'other license')
+    self.assertNotEqual(jinja.get_asset_digest('main/LICENSE'), cached)
+
+  def stat_key(self):
+    info = os.stat(self.license)
+    return [info.st_size, info.st_mtime, info.st_ino]
+
+
+class FeatureJinjaCatalogTest(FeatureJinjaCopyFolderTest):
+
+  def setUp(self):
+    super(FeatureJinjaCatalogTest, self).setUp()
+    os.makedirs(os.path.join(self.dst, '.crutch'))
+    self.renv.set_prop('crutch_directory', os.path.join(self.dst, '.crutch'))
+    self.renv.set_prop('crutch_version', '0.3.0')
+    self.renv.set_prop('crutch_jinja_catalog', True)
+
+  def tearDown(self):
+    CATALOGS.pop(self.templates, None)
+    super(FeatureJinjaCatalogTest, self).tearDown()
+
+  def reload(self):
+    CATALOGS.pop(self.templates, None)
+    return self.jinja.get_catalog()
+
+  def test_save_load(self):
+    names = self.jinja.get_catalog().names
+    self.assertTrue(os.path.exists(self.jinja.get_catalog_filename()))
+    self.assertEqual(self.jinja.load_catalog(), names)
+
+    # Persisted names are used instead of listing the templates
+    self.jinja.jenv.list_templates = None
+    self.assertEqual(self.reload().names, names)
+
+  def test_invalidated_by_templates(self):
+    self.jinja.get_catalog()
+
+    write_file(os.path.join(self.templates, 'NEW'), 'new')
+    self.assertIsNone(self.jinja.load_catalog())
+    self.assertIn('NEW', self.reload().names)
+
+    os.remove(os.path.join(self.templates, 'NEW'))
+    self.assertIsNone(self.jinja.load_catalog())
+    self.assertNotIn('NEW', self.reload().names)
+
+  def test_stamp_is_single_stat(self):
+    self.jinja.get_catalog()
+    walk = os.walk
+    os.walk = None
+    try:
+      self.assertIsNotNone(self.jinja.load_catalog())
+    finally:
+      os.walk = walk
+
+  def test_invalidated_by_version(self):
+    self.jinja.get_catalog()
+    self.renv.set_prop('crutch_version', '0.4.0')
+    self.assertIsNone(self.jinja.load_catalog())
+
+
+class FeatureJinjaBundleTest(FeatureJinjaCopyFolderTest):
+
+  def setUp(self):
+    super(FeatureJinjaBundleTest, self).setUp()
+    filename = os.path.join(self.dir, 'templates.zip')
+    pack(self.templates, filename)
+
+    self.jinja.bundle = TemplateBundle(filename)
+    self.jinja.templates = filename
+    self.jinja.jenv = jinja2.Environment(loader=BundleLoader(self.jinja.bundle))
+
+  def test_loader(self):
+    self.jinja.mirror_repl_to_jinja_globals()
+    self.assertIn('main/LICENSE', self.jinja.jenv.list_templates())
+    self.assertEqual(
+        self.jinja.jenv.get_template('main/NameRepl/file1.txt.jinja').render(),
+        'blah 1')
+    with self.assertRaises(jinja2.TemplateNotFound):
+      self.jinja.jenv.get_template('main/missing')
+
+
+class FeatureJinjaUpdateTest(FeatureJinjaCopyFolderTest):
+
+  def setUp(self):
+    super(FeatureJinjaUpdateTest, self).setUp()
+    self.crutch_directory = os.path.join(self.dst, '.crutch')
+    os.makedirs(self.crutch_directory)
+    self.renv.set_prop('crutch_directory', self.crutch_directory)
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'})
+
+  def test_manifest(self):
+    manifest = self.jinja.get_manifest()
+    self.assertEqual(
+        manifest.get(os.path.join(self.dst, 'blah', 'file0.txt'))['template'],
+        'main/NameRepl/file0.txt.jinja')
+    self.assertIsNotNone(manifest.get(os.path.join(self.dst, 'LICENSE')))
+
+  def test_inputs_in_update_only(self):
+    manifest = self.jinja.get_manifest()
+    record = manifest.get(os.path.join(self.dst, 'blah', 'file0.txt'))
+    self.assertIsNone(record['source'])
+    self.assertIsNone(record['inputs'])
+
+    # Plain copy renders straight from the loader
+    def get_source(*_):
+      raise AssertionError('source was read')
+    self.jinja.get_source = get_source
+    shutil.rmtree(os.path.join(self.dst, 'blah'))
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'})
+    del self.jinja.get_source
+
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'}, update=True)
+    manifest = self.jinja.get_manifest()
+    record = manifest.get(os.path.join(self.dst, 'blah', 'file0.txt'))
+    self.assertIsNotNone(record['inputs'])
+
+  def test_assets_not_read(self):
+    def get_asset_digest(*_):
+      raise AssertionError('asset was read')
+    self.jinja.get_asset_digest = get_asset_digest
+    os.remove(os.path.join(self.dst, 'LICENSE'))
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'})
+    del self.jinja.get_asset_digest
+
+    copied = os.path.join(self.dst, 'LICENSE')
+    record = self.jinja.get_manifest().get(copied)
+    self.assertIsNone(record['source'])
+    self.assertEqual(record['output'], get_file_stamp(copied))
+
+  def test_update_assets(self):
+    copied = os.path.join(self.dst, 'LICENSE')
+    write_file(os.path.join(self.templates, 'main', 'LICENSE'), 'new license')
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'}, update=True)
+    self.assertEqual(read_file(copied), 'new license')
+
+    # Edited copy is kept
+    write_file(copied, 'mine, longer')
+    write_file(os.path.join(self.templates, 'main', 'LICENSE'), 'newer')
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'}, update=True)
+    self.assertEqual(read_file(copied), 'mine, longer')
+
+  def test_update_unchanged(self):
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'}, update=True)
+    plan = self.jinja.plan_folder('main', self.dst, {'NameRepl': 'blah'}, True)
+    self.assertEqual(len(plan), 10)
+
+    manifest = self.jinja.get_manifest()
+    for entry in plan:
+      self.assertIsNone(self.jinja.materialize(entry, manifest, True))
+
+  def test_update_changed_inputs(self):
+    edited = os.path.join(self.dst, 'blah', 'file1.txt')
+    write_file(edited, 'mine')
+    os.remove(os.path.join(self.dst, 'blah', 'file2.txt'))
+
+    self.renv.set_prop('test_name', 'bleh', mirror_to_repl=True)
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'}, update=True)
+
+    self.assertEqual(
+        read_file(os.path.join(self.dst, 'blah', 'file0.txt')), 'bleh 0')
+    self.assertEqual(
+        read_file(os.path.join(self.dst, 'blah', 'file2.txt')), 'bleh 2')
+    self.assertEqual(read_file(edited), 'mine')
+
+  def test_update_unknown_file(self):
+    mine = os.path.join(self.dst, 'blah', 'file0.txt')
+    shutil.rmtree(self.crutch_directory)
+    os.makedirs(self.crutch_directory)
+    write_file(mine, 'mine')
+
+    self.jinja.copy_folder('main', self.dst, {'NameRepl': 'blah'}, update=True)
+    self.assertEqual(read_file(mine), 'mine')
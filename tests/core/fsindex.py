@@ -0,0 +1,90 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017 Artyom Goncharov
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
+# OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+import unittest
+import tempfile
+import shutil
+import os
+
+from crutch.core.fsindex import DirectoryIndex
+
+
+class CancelledRequest(object):
+
+  def is_cancelled(self):
+    return True
+
+
+class DirectoryIndexTest(unittest.TestCase):
+
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    self.walked = list()
+    self.index = DirectoryIndex([self.folder], self.collect)
+
+  def tearDown(self):
+    shutil.rmtree(self.folder)
+
+  def collect(self, root, path, _, files):
+    self.walked.append(path)
+    for name in files:
+      yield os.path.relpath(os.path.join(path, name), root)
+
+  def touch(self, *path):
+    path = os.path.join(self.folder, *path)
+    if not os.path.exists(os.path.dirname(path)):
+      os.makedirs(os.path.dirname(path))
+    open(path, 'w').close()
+
+  def test_cached(self):
+    self.touch('a', 'x.cpp')
+    self.assertEqual(self.index.get(), [os.path.join('a', 'x.cpp')])
+    self.assertEqual(len(self.walked), 2)
+
+    # Nothing has changed, so nothing is walked
+    self.assertEqual(self.index.get(), [os.path.join('a', 'x.cpp')])
+    self.assertEqual(len(self.walked), 2)
+
+  def test_refreshed(self):
+    self.touch('a', 'x.cpp')
+    self.index.get()
+
+    self.touch('a', 'b', 'y.cpp')
+    self.assertEqual(
+        self.index.get(),
+        [os.path.join('a', 'x.cpp'), os.path.join('a', 'b', 'y.cpp')])
+
+    os.remove(os.path.join(self.folder, 'a', 'x.cpp'))
+    self.assertEqual(self.index.get(), [os.path.join('a', 'b', 'y.cpp')])
+
+  def test_missing_root(self):
+    index = DirectoryIndex([os.path.join(self.folder, 'r')], self.collect)
+    self.assertEqual(index.get(), [])
+
+    self.touch('r', 'x.cpp')
+    self.assertEqual(index.get(), ['x.cpp'])
+
+  def test_cancelled(self):
+    self.touch('x.cpp')
+    self.assertIsNone(self.index.get(CancelledRequest()))
+    self.assertEqual(self.walked, [])
+    self.assertEqual(self.index.get(), ['x.cpp'])
@@ -0,0 +1,39 @@
+import unittest
+
+from crutch.core.graph import DiGraph
+
+
+class DiGraphTest(unittest.TestCase):
+
+  def setUp(self):
+    self.graph = DiGraph()
+    self.graph.add_edge('delta', 'charlie')
+    self.graph.add_edge('charlie', 'bravo')
+    self.graph.add_edge('delta', 'bravo')
+    self.graph.add_node('alpha')
+
+  def test_edges(self):
+    self.assertTrue(self.graph.has_edge('delta', 'charlie'))
+    self.assertFalse(self.graph.has_edge('charlie', 'delta'))
+    self.assertEqual(self.graph.predecessors('bravo'), ['charlie', 'delta'])
+    self.assertEqual(self.graph.successors('delta'), ['charlie', 'bravo'])
+
+  def test_topological_sort(self):
+    self.assertEqual(
+        self.graph.topological_sort(),
+        ['delta', 'alpha', 'charlie', 'bravo'])
+
+  def test_topological_sort_subset(self):
+    self.assertEqual(
+        self.graph.topological_sort(['bravo', 'delta', 'oscar']),
+        ['delta', 'bravo'])
+
+  def test_reversed_topological_sort(self):
+    self.assertEqual(
+        self.graph.topological_sort(['bravo', 'charlie', 'delta'], True),
+        ['bravo', 'charlie', 'delta'])
+
+  @unittest.expectedFailure
+  def test_cycle(self):
+    self.graph.add_edge('bravo', 'delta')
+    self.graph.topological_sort()
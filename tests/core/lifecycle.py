@@ -0,0 +1,52 @@
+import unittest
+
+import crutch.core.lifecycle as Lifecycle
+
+
+class LifecycleTest(unittest.TestCase):
+
+  def setUp(self):
+    self.lifecycle = Lifecycle.Lifecycle()
+    self.calls = list()
+
+  def test_dispatch(self):
+    self.lifecycle.add_hook_before(Lifecycle.CONFIG_LOAD, self.calls.append)
+    self.lifecycle.add_hook_after(
+        Lifecycle.CONFIG_LOAD, lambda: self.calls.append('after'))
+
+    self.lifecycle.mark_before(Lifecycle.CONFIG_LOAD, 'info')
+    self.lifecycle.mark_after(Lifecycle.CONFIG_LOAD)
+    self.lifecycle.mark(Lifecycle.CONFIG_LOAD)
+    self.lifecycle.mark_before(Lifecycle.CONFIG_FLUSH)
+
+    self.assertEqual(self.calls, ['info', 'after'])
+    self.assertEqual(
+        self.lifecycle.table[(Lifecycle.CONFIG_LOAD, Lifecycle.ORDER_BEFORE)],
+        (self.calls.append,))
+
+  def test_observed(self):
+    self.assertFalse(self.lifecycle.observed)
+
+    self.lifecycle.enable_tracing()
+    self.assertTrue(self.lifecycle.observed)
+    self.lifecycle.disable_tracing()
+    self.assertFalse(self.lifecycle.observed)
+
+    self.lifecycle.add_listener(lambda *args: self.calls.append(args))
+    self.assertTrue(self.lifecycle.observed)
+    self.lifecycle.mark_after(Lifecycle.RUNNER_RUN, 'build')
+    self.lifecycle.mark_after(Lifecycle.RUNNER_RUN, 'test', 1.5)
+    self.assertEqual(self.calls, [
+        (Lifecycle.RUNNER_RUN, Lifecycle.ORDER_AFTER, 'build', None),
+        (Lifecycle.RUNNER_RUN, Lifecycle.ORDER_AFTER, 'test', 1.5)])
+
+  def test_untraced(self):
+    def observe(*_):
+      raise AssertionError('untraced mark was observed')
+
+    self.lifecycle.observe = observe
+    self.lifecycle.add_hook_before(Lifecycle.RUNNER_RUN, self.calls.append)
+    self.lifecycle.mark_before(Lifecycle.RUNNER_RUN, 'build')
+    self.lifecycle.mark_after(Lifecycle.RUNNER_RUN, 'build')
+    self.assertFalse(self.lifecycle.observed)
+    self.assertEqual(self.calls, ['build'])
@@ -47,3 +47,34 @@ class MenuTest(unittest.TestCase):
     opts = menu.parse(['file', 'add', 'core/feature'])
     expected = {'run_feature': 'file', 'action': 'add', 'group': 'core/feature'}
     self.assertDictContainsSubset(expected, opts)
+
+  def test_lazy_parsers(self):
+    menu = self.renv.menu
+    built = list()
+
+    for name in ['build', 'test', 'file']:
+      feature = menu.add_feature(name, name)
+      feature.add_actions().add_action('default')
+      build = feature.build
+      feature.build = lambda subparsers, n=name, b=build: \
+          built.append(n) or b(subparsers)
+
+    self.assertEqual(built, [])
+
+    opts = menu.parse(['test'])
+    self.assertEqual(opts['run_feature'], 'test')
+    self.assertEqual(built, ['test'])
+
+  def test_get_action(self):
+    menu = self.renv.menu
+    actions = menu.add_feature('test', 'Test project').add_actions()
+    default = actions.add_action('default')
+    remove = actions.add_action('remove', 'Remove test', interactive=True)
+
+    self.assertIs(menu.get_action(['test', 'remove', 'alpha']), remove)
+    self.assertIs(menu.get_action(['test', '-c', 'debug']), default)
+    self.assertIs(menu.get_action(['test']), default)
+    self.assertIsNone(menu.get_action(['build']))
+    self.assertTrue(remove.interactive)
+    self.assertFalse(default.interactive)
+
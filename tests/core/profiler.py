@@ -0,0 +1,124 @@
+import unittest
+import tempfile
+import shutil
+import json
+import os
+
+import crutch.core.lifecycle as Lifecycle
+
+from crutch.core.runtime import RuntimeEnvironment
+from crutch.core.profiler import Profiler, get_monotonic_clock
+
+
+class FakeClock(object):
+
+  def __init__(self):
+    self.now = 0.0
+
+  def __call__(self):
+    return self.now
+
+  def advance(self, seconds):
+    self.now += seconds
+
+
+class ProfilerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.dir = tempfile.mkdtemp()
+    self.clock = FakeClock()
+    self.renv = RuntimeEnvironment(None)
+    self.renv.set_prop('crutch_directory', self.dir)
+    self.profiler = Profiler(self.renv, clock=self.clock)
+    self.lifecycle = self.renv.lifecycle
+
+  def tearDown(self):
+    shutil.rmtree(self.dir)
+
+  def run_phases(self):
+    self.lifecycle.mark(Lifecycle.CRUTCH_START)
+    self.lifecycle.mark_before(Lifecycle.FEATURE_CREATION, ['cpp'])
+    self.clock.advance(0.001)
+    self.lifecycle.mark_before(Lifecycle.CATEGORY_ACTIVATE, 'build')
+    self.clock.advance(0.002)
+    self.lifecycle.mark_after(Lifecycle.CATEGORY_ACTIVATE, 'build')
+    self.lifecycle.mark_before(Lifecycle.TEMPLATE_RENDER, '/tmp/a')
+    self.clock.advance(0.0005)
+    self.lifecycle.mark_after(Lifecycle.TEMPLATE_RENDER, '/tmp/a')
+    self.clock.advance(0.0005)
+    self.lifecycle.mark_after(Lifecycle.FEATURE_CREATION, ['cpp'])
+    self.lifecycle.mark(Lifecycle.CRUTCH_STOP)
+
+  def test_spans(self):
+    self.run_phases()
+    spans = dict((s.phase, s) for s in self.profiler.spans)
+
+    creation = spans[Lifecycle.FEATURE_CREATION]
+    self.assertEqual(creation.depth, 0)
+    self.assertAlmostEqual(creation.get_duration(), 0.004)
+
+    activate = spans[Lifecycle.CATEGORY_ACTIVATE]
+    self.assertEqual(activate.depth, 1)
+    self.assertEqual(activate.info, 'build')
+    self.assertAlmostEqual(activate.start, 0.001)
+
+    render = spans[Lifecycle.TEMPLATE_RENDER]
+    self.assertEqual(render.info, '/tmp/a')
+    self.assertEqual(render.depth, 1)
+    self.assertAlmostEqual(render.get_duration(), 0.0005)
+
+  def test_interleaved(self):
+    # Parallel features mark the same phase before either of them is done
+    self.lifecycle.mark_before(Lifecycle.FEATURE_SET_UP, 'file')
+    self.clock.advance(0.001)
+    self.lifecycle.mark_before(Lifecycle.FEATURE_SET_UP, 'make')
+    self.clock.advance(0.001)
+    self.lifecycle.mark_after(Lifecycle.FEATURE_SET_UP, 'file')
+    self.clock.advance(0.003)
+    self.lifecycle.mark_after(Lifecycle.FEATURE_SET_UP, 'make')
+
+    spans = dict((s.info, s) for s in self.profiler.spans)
+    self.assertAlmostEqual(spans['file'].start, 0.0)
+    self.assertAlmostEqual(spans['file'].get_duration(), 0.002)
+    self.assertAlmostEqual(spans['make'].start, 0.001)
+    self.assertAlmostEqual(spans['make'].get_duration(), 0.004)
+    self.assertEqual(spans['file'].depth, 0)
+
+  def test_replayed(self):
+    # Marks emitted after the fact carry the times they happened at
+    self.assertIs(self.lifecycle.clock, self.clock)
+    self.clock.advance(0.010)
+    self.lifecycle.mark_before(Lifecycle.FEATURE_SET_UP, 'file', 0.001)
+    self.lifecycle.mark_after(Lifecycle.FEATURE_SET_UP, 'file', 0.004)
+
+    span = self.profiler.spans[0]
+    self.assertAlmostEqual(span.start, 0.001)
+    self.assertAlmostEqual(span.get_duration(), 0.003)
+
+  def test_different_after_info(self):
+    self.lifecycle.mark_before(Lifecycle.FEATURE_CREATION, ['cpp'])
+    self.clock.advance(0.001)
+    self.lifecycle.mark_after(Lifecycle.FEATURE_CREATION, ['build', 'test'])
+
+    span = self.profiler.spans[0]
+    self.assertEqual(span.info, ['cpp'])
+    self.assertAlmostEqual(span.get_duration(), 0.001)
+
+  def test_save(self):
+    self.run_phases()
+
+    with open(os.path.join(self.dir, 'profile.json')) as fin:
+      trace = json.load(fin)
+    names = [e['name'] for e in trace['traceEvents'] if e['ph'] == 'X']
+    self.assertEqual(names[0], Lifecycle.FEATURE_CREATION)
+    self.assertIn(Lifecycle.CATEGORY_ACTIVATE, names)
+
+    with open(os.path.join(self.dir, 'profile.txt')) as fin:
+      lines = fin.read().splitlines()
+    self.assertTrue(lines[0].startswith('PHASE'))
+    self.assertTrue(lines[1].startswith(Lifecycle.FEATURE_CREATION))
+
+  def test_monotonic_clock(self):
+    clock = get_monotonic_clock()
+    first = clock()
+    self.assertLessEqual(first, clock())
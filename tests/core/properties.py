@@ -62,6 +62,37 @@ class FlatJSONConfigTest(unittest.TestCase):
 
     self.assertDictContainsSubset(DATA, reader)
 
+  def test_config_flush_unchanged(self):
+    self.config.update(DATA)
+    self.assertTrue(self.config.flush())
+    self.assertFalse(self.config.flush())
+
+    # Writing the same values does not change the content
+    self.config.update(DATA)
+    self.assertFalse(self.config.flush())
+
+    self.config['project_name'] = 'other'
+    self.assertTrue(self.config.flush())
+
+    reader = FlatJSONConfig(self.filename)
+    reader.load()
+    self.assertFalse(reader.flush())
+    self.assertEqual(reader['project_name'], 'other')
+
+    # No temporary files are left behind
+    self.assertEqual(os.listdir(self.dir), ['config.json'])
+
+  def test_config_flush_in_place(self):
+    self.config['project_features'] = ['build']
+    self.assertTrue(self.config.flush())
+
+    self.config['project_features'].append('test')
+    self.assertTrue(self.config.flush())
+
+    reader = FlatJSONConfig(self.filename)
+    reader.load()
+    self.assertEqual(reader['project_features'], ['build', 'test'])
+
   def test_config_delete(self):
     shutil.copy(DATA_CONFIG, self.filename)
     self.config.load()
@@ -79,6 +110,22 @@ class FlatJSONConfigTest(unittest.TestCase):
     self.assertIn('project_type', self.config.keys())
     self.assertIn('project_features', self.config.keys())
 
+  def test_config_index(self):
+    self.config['project_name'] = 'blah'
+    self.config['project'] = {'type': 'test', 'build': {'config': 'debug'}}
+
+    self.assertItemsEqual(
+        ['project_type', 'project_build_config'], self.config.keys())
+    self.assertNotIn('project_name', self.config)
+    self.assertNotIn('project', self.config)
+
+    del self.config['project_build']
+    self.assertItemsEqual(['project_type'], self.config.keys())
+
+    self.config['project_type'] = {'name': 'cpp'}
+    self.assertItemsEqual(['project_type_name'], self.config.keys())
+    self.assertEqual(self.config['project_type_name'], 'cpp')
+
 
 class PropertiesRuntimeDataTest(unittest.TestCase):
   """
@@ -195,3 +242,43 @@ class PropertiesConfigDataTest(unittest.TestCase):
     self.assertNotIn('project_name', self.props.config)
     self.assertNotIn('project_type', self.props.config)
     self.assertNotIn('project_features', self.props.config)
+
+
+class PropertiesResolutionTest(unittest.TestCase):
+
+  def setUp(self):
+    self.props = Properties()
+
+  def test_layer_precedence(self):
+    self.props.defaults['name'] = 'defaults'
+    self.assertEqual(self.props.get_provider_name('name'), 'defaults')
+
+    self.props.config_update('name', 'config')
+    self.assertEqual(self.props.get_provider_name('name'), 'config')
+
+    self.props.update_cli({'name': 'cli'})
+    self.assertEqual(self.props.get_provider_name('name'), 'cli')
+
+    self.props['name'] = 'stage'
+    self.assertEqual(self.props.get_provider_name('name'), 'stage')
+    self.assertEqual(self.props['name'], 'stage')
+
+    del self.props['name']
+    self.assertEqual(self.props['name'], 'cli')
+
+    del self.props.cli['name']
+    self.props.config_delete('name')
+    self.assertEqual(self.props['name'], 'defaults')
+
+    del self.props.defaults['name']
+    self.assertNotIn('name', self.props)
+    self.assertIsNone(self.props.get_provider_name('name'))
+
+  def test_nested_config_write(self):
+    self.props.config_update('project', {'name': 'blah', 'type': 'test'})
+    self.assertIn('project_name', self.props)
+    self.assertIn('project_type', self.props)
+
+    self.props.config_update('project', 'flat')
+    self.assertNotIn('project_name', self.props)
+    self.assertEqual(self.props['project'], 'flat')
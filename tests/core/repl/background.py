@@ -0,0 +1,142 @@
+# -*- coding: utf-8 -*-
+
+# Copyright © 2017 Artyom Goncharov
+#
+# Permission is hereby granted, free of charge, to any person obtaining
+# a copy of this software and associated documentation files (the "Software"),
+# to deal in the Software without restriction, including without limitation
+# the rights to use, copy, modify, merge, publish, distribute, sublicense,
+# and/or sell copies of the Software, and to permit persons to whom the
+# Software is furnished to do so, subject to the following conditions:
+#
+# The above copyright notice and this permission notice shall be included
+# in all copies or substantial portions of the Software.
+#
+# THE SOFTWARE IS PROVIDED "AS IS", WITHOUT WARRANTY OF ANY KIND,
+# EXPRESS OR IMPLIED, INCLUDING BUT NOT LIMITED TO THE WARRANTIES
+# OF MERCHANTABILITY, FITNESS FOR A PARTICULAR PURPOSE AND NONINFRINGEMENT.
+# IN NO EVENT SHALL THE AUTHORS OR COPYRIGHT HOLDERS BE LIABLE FOR ANY CLAIM,
+# DAMAGES OR OTHER LIABILITY, WHETHER IN AN ACTION OF CONTRACT,
+# TORT OR OTHERWISE, ARISING FROM, OUT OF OR IN CONNECTION WITH THE SOFTWARE
+# OR THE USE OR OTHER DEALINGS IN THE SOFTWARE.
+
+from __future__ import unicode_literals
+
+import threading
+import unittest
+
+from prompt_toolkit.document import Document
+
+from crutch.core.runtime import RuntimeEnvironment
+from crutch.core.menu import create_crutch_menu
+from crutch.core.repl.background import BackgroundCompletions, run_provider
+from crutch.core.repl.completer import CrutchCompleter
+
+TIMEOUT = 5
+
+
+class BlockingProvider(object):
+
+  def __init__(self, values):
+    self.values = values
+    self.started = threading.Event()
+    self.release = threading.Event()
+    self.calls = 0
+
+  def __call__(self, request):
+    self.calls += 1
+    self.started.set()
+    self.release.wait(TIMEOUT)
+    for value in self.values:
+      if request.is_cancelled():
+        return
+      yield value
+
+
+class BackgroundCompletionsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.ready = threading.Event()
+    self.background = BackgroundCompletions(self.ready.set)
+
+  def test_run_provider(self):
+    self.assertEqual(run_provider(lambda _: iter(['a', 'b'])), ['a', 'b'])
+
+  def test_get(self):
+    provider = BlockingProvider(['alpha', 'bravo'])
+    self.assertIsNone(self.background.get(provider))
+    self.assertTrue(provider.started.wait(TIMEOUT))
+
+    # Asking again while it runs does not restart it
+    self.assertIsNone(self.background.get(provider))
+    provider.release.set()
+
+    self.assertTrue(self.ready.wait(TIMEOUT))
+    self.assertEqual(self.background.get(provider), ['alpha', 'bravo'])
+    self.assertEqual(provider.calls, 1)
+
+  def test_cancel(self):
+    slow = BlockingProvider(['alpha'])
+    fast = BlockingProvider(['bravo'])
+    fast.release.set()
+
+    self.background.get(slow)
+    self.assertTrue(slow.started.wait(TIMEOUT))
+
+    # A newer request supersedes the running one
+    self.background.get(fast)
+    slow.release.set()
+
+    self.assertTrue(self.ready.wait(TIMEOUT))
+    self.assertEqual(self.background.get(fast), ['bravo'])
+    self.assertNotIn(slow, self.background.results)
+
+  def test_invalidate(self):
+    provider = BlockingProvider(['alpha'])
+    provider.release.set()
+    self.background.get(provider)
+    self.assertTrue(self.ready.wait(TIMEOUT))
+
+    self.background.invalidate()
+    self.assertIsNone(self.background.get(provider))
+
+
+class ProvidedCompletionsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.renv = RuntimeEnvironment(None)
+    self.renv.menu = create_crutch_menu(self.renv)
+    self.provider = BlockingProvider(['alpha', 'alpine', 'bravo'])
+    self.provider.release.set()
+
+    actions = self.renv.menu.add_feature('test', 'test').add_actions()
+    default = actions.add_action('default')
+    default.add_argument(
+        '-t', '--tests', dest='tests', nargs='*', provider=self.provider)
+    actions.add_action('remove').add_argument(
+        dest='test', provider=self.provider)
+
+  def complete(self, completer, text):
+    return [c.text for c in completer.get_completions(Document(text), None)]
+
+  def test_in_place(self):
+    completer = CrutchCompleter(self.renv)
+    self.assertEqual(
+        self.complete(completer, 'test remove al'), ['alpha', 'alpine'])
+    self.assertEqual(
+        self.complete(completer, 'test remove alpha '), ['--directory'])
+    self.assertEqual(
+        self.complete(completer, 'test -t alpha '), ['alpine', 'bravo'])
+
+  def test_background(self):
+    ready = threading.Event()
+    background = BackgroundCompletions(ready.set)
+    completer = CrutchCompleter(self.renv, background=background)
+
+    # Menu completions do not wait for the provider
+    self.assertEqual(self.complete(completer, 'test remove al'), [])
+    self.assertTrue(ready.wait(TIMEOUT))
+    self.assertEqual(
+        self.complete(completer, 'test remove al'), ['alpha', 'alpine'])
+    self.assertEqual(self.complete(completer, 'test remove b'), ['bravo'])
+    self.assertEqual(self.provider.calls, 1)
@@ -0,0 +1,72 @@
+from __future__ import unicode_literals
+
+import unittest
+
+from prompt_toolkit.document import Document
+
+import crutch.core.lifecycle as Lifecycle
+
+from crutch.core.runtime import RuntimeEnvironment
+from crutch.core.menu import create_crutch_menu
+from crutch.core.repl.completer import CrutchCompleter
+from crutch.core.repl.index import PrefixTrie
+
+
+class PrefixTrieTest(unittest.TestCase):
+
+  def test_find(self):
+    trie = PrefixTrie()
+    for word in ['test', 'temp', 'build', 'te']:
+      trie.add(word, word.upper())
+
+    self.assertEqual(trie.find('te'), ['test', 'temp', 'te'])
+    self.assertEqual(trie.find('tes'), ['test'])
+    self.assertEqual(trie.find('x'), [])
+    self.assertEqual(len(trie.find('')), 4)
+    self.assertEqual(trie.get('temp'), 'TEMP')
+
+
+class CrutchCompleterTest(unittest.TestCase):
+
+  def setUp(self):
+    self.renv = RuntimeEnvironment(None)
+    self.renv.menu = create_crutch_menu(self.renv)
+    self.add_feature('build')
+    self.completer = CrutchCompleter(self.renv)
+
+  def add_feature(self, name):
+    actions = self.renv.menu.add_feature(name, name).add_actions()
+    default = actions.add_action('default')
+    default.add_argument(
+        '-c', '--config', dest='config', choices=['debug', 'release'])
+    default.add_argument('-t', '--tests', dest='tests', nargs='*')
+    actions.add_action('add').add_argument(dest='group')
+
+  def complete(self, text):
+    return [c.text for c in self.completer.get_completions(Document(text), None)]
+
+  def test_features(self):
+    self.assertEqual(self.complete(''), ['build'])
+    self.assertEqual(self.complete('bu'), ['build'])
+    self.assertEqual(self.complete('x'), [])
+
+  def test_actions(self):
+    self.assertEqual(
+        self.complete('build '), ['add', '--directory', '--config', '--tests'])
+    self.assertEqual(self.complete('build a'), ['add'])
+
+  def test_options(self):
+    self.assertEqual(self.complete('build --c'), ['--config'])
+    self.assertEqual(self.complete('build -c'), ['--config'])
+    self.assertEqual(self.complete('build --config '), ['debug', 'release'])
+    self.assertEqual(self.complete('build --config r'), ['release'])
+    self.assertEqual(
+        self.complete('build --config debug '), ['--directory', '--tests'])
+
+  def test_rebuilt_on_activation(self):
+    self.assertEqual(self.complete('te'), [])
+    self.add_feature('test')
+    self.assertEqual(self.complete('te'), [])
+
+    self.renv.lifecycle.mark_after(Lifecycle.FEATURE_CREATION, ['test'])
+    self.assertEqual(self.complete('te'), ['test'])
@@ -0,0 +1,61 @@
+from __future__ import unicode_literals
+
+import unittest
+
+from pygments.token import Keyword, Text, Name
+from prompt_toolkit.document import Document
+
+from crutch.core.runtime import RuntimeEnvironment
+from crutch.core.menu import create_crutch_menu
+from crutch.core.repl.lexer import create_lexer, get_actions_list
+from crutch.core.repl.tokenizer import Tokenizer
+
+
+class CommandLexerTest(unittest.TestCase):
+
+  def setUp(self):
+    renv = RuntimeEnvironment(None)
+    menu = self.menu = create_crutch_menu(renv)
+    actions = menu.add_feature('test', 'Test').add_actions()
+    actions.add_action('default').add_argument(
+        '-c', '--config', dest='config', choices=['debug', 'release'])
+    actions.add_action('add')
+    self.tokenizer = Tokenizer()
+    self.lexer = create_lexer(self.tokenizer, menu)
+
+  def test_line(self):
+    get_line = self.lexer.lex_document(None, Document('test  -c debug test'))
+    self.assertEqual(get_line(0), [
+        (Keyword.Namespace, 'test'),
+        (Text, '  '),
+        (Keyword.Type, '-c'),
+        (Text, ' '),
+        (Name, 'debug'),
+        (Text, ' '),
+        (Text, 'test')])
+    self.assertEqual(get_line(1), [])
+
+  def test_cached_tables(self):
+    tables = get_actions_list(self.menu)
+    self.assertIs(get_actions_list(self.menu), tables)
+
+    self.menu.add_feature('build', 'Build').add_actions().add_action('make')
+    self.assertIsNot(get_actions_list(self.menu), tables)
+    self.assertIn('make', get_actions_list(self.menu)[1])
+
+  def test_cached_lines(self):
+    document = Document('test add')
+    first = self.lexer.lex_document(None, document)(0)
+
+    calls = []
+    tokenize = self.tokenizer.tokenize
+    self.tokenizer.tokenize = lambda text: calls.append(text) or tokenize(text)
+
+    self.assertIs(self.lexer.lex_document(None, document)(0), first)
+    self.assertEqual(calls, [])
+
+    # New features are highlighted as soon as they show up in the menu
+    self.menu.add_feature('build', 'Build')
+    get_line = self.lexer.lex_document(None, Document('build'))
+    self.assertEqual(get_line(0), [(Keyword.Namespace, 'build')])
+    self.assertEqual(calls, ['build'])
@@ -0,0 +1,46 @@
+from __future__ import unicode_literals
+
+import unittest
+import shlex
+
+from crutch.core.repl.tokenizer import Tokenizer
+
+
+class TokenizerTest(unittest.TestCase):
+
+  def setUp(self):
+    self.tokenizer = Tokenizer()
+
+  def test_same_as_shlex(self):
+    for text in [
+        '',
+        'test',
+        '  test  -t a b  ',
+        'test -t "a b" \'c d\' e\\ f',
+        'new "say \\"hi\\"" \'no \\ escape\' x"y"z']:
+      self.assertEqual(
+          self.tokenizer.split(text),
+          [w.decode('utf-8') for w in shlex.split(text.encode('utf-8'))])
+
+  def test_incremental(self):
+    text = 'test -t alpha'
+    first = self.tokenizer.tokenize(text)
+
+    text += ' bravo'
+    second = self.tokenizer.tokenize(text)
+    self.assertEqual([t.value for t in second], ['test', '-t', 'alpha', 'bravo'])
+
+    # Tokens before the edit point are reused as is
+    self.assertIs(second[0], first[0])
+    self.assertIs(second[1], first[1])
+    self.assertIsNot(second[2], first[2])
+
+    second = self.tokenizer.tokenize('test -x alpha bravo')
+    self.assertEqual([t.value for t in second], ['test', '-x', 'alpha', 'bravo'])
+
+  def test_unclosed(self):
+    tokens = self.tokenizer.tokenize('test "alpha br')
+    self.assertEqual(tokens[-1].value, 'alpha br')
+    self.assertFalse(tokens[-1].closed)
+    with self.assertRaises(ValueError):
+      self.tokenizer.split('test "alpha br')
@@ -58,3 +58,41 @@ class ReplacementsTest(unittest.TestCase):
     self.assertNotIn('key', repl)
     self.assertIn('blah', repl)
     self.assertEqual(repl['blah'], 'ooooo')
+
+  @unittest.expectedFailure
+  def test_conflict(self):
+    repl = Replacements()
+    repl.add_provider('one')['key'] = 'one'
+    repl.add_provider('two')['key'] = 'two'
+    repl.fetch()
+
+  def test_key_moved_between_providers(self):
+    repl = Replacements()
+    one = repl.add_provider('one')
+    two = repl.add_provider('two')
+
+    one['key'] = 'one'
+    repl.fetch()
+
+    del one['key']
+    two['key'] = 'two'
+    repl.fetch()
+    self.assertEqual(repl['key'], 'two')
+
+  def test_unchanged_providers_are_skipped(self):
+    repl = Replacements()
+    stat = repl.add_provider('stat')
+    gen = repl.add_provider('gen', GenerativeProvider({'blah': 'ooooo'}))
+    stat['key'] = 'value'
+    repl.fetch()
+
+    merged = dict(repl.merged)
+    repl.fetch()
+    self.assertIs(merged['stat'], repl.merged['stat'])
+    self.assertIs(merged['gen'], repl.merged['gen'])
+
+    gen.mod = {'blah': 'aaaaa'}
+    repl.fetch()
+    self.assertIs(merged['stat'], repl.merged['stat'])
+    self.assertIsNot(merged['gen'], repl.merged['gen'])
+    self.assertEqual(repl['blah'], 'aaaaa')
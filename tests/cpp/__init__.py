@@ -7,4 +7,7 @@ def get_suite():
   import tests.cpp.new as new
   suite.addTest(loader.loadTestsFromModule(new))
 
+  import tests.cpp.startup as startup
+  suite.addTest(loader.loadTestsFromModule(startup))
+
   return suite
@@ -7,6 +7,7 @@ import tempfile
 import os
 
 from crutch import create_driver
+from crutch.core.runtime import RuntimeEnvironment
 
 THIS_FOLDER = os.path.abspath(os.path.dirname(__file__))
 
@@ -27,5 +28,85 @@ class NewCPPTestCleanProjectFolder(unittest.TestCase):
     shutil.rmtree(folder)
 
 
+class NewCPPTestFeatureUpdate(unittest.TestCase):
+
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    # Explicit features leave out the `feature` one itself
+    self.run_driver(
+        ['new', 'cpp', '-f', 'build', 'test', '--directory', self.folder])
+
+  def tearDown(self):
+    shutil.rmtree(self.folder)
+    RuntimeEnvironment.Default = None
+
+  def run_driver(self, argv):
+    # Every driver registers its runtime environment as the default one
+    RuntimeEnvironment.Default = None
+    driver = create_driver(argv)
+    self.assertEqual(driver.run(), 0)
+    return driver
+
+  def update(self):
+    # Existing projects are looked up from the working directory
+    cwd = os.getcwd()
+    os.chdir(self.folder)
+    try:
+      return self.run_driver(['feature', 'update'])
+    finally:
+      os.chdir(cwd)
+
+  def test_daemon_stage(self):
+    driver = create_driver(['feature'])
+    runner = driver.prepare(self.folder)
+    props = driver.renv.props
+
+    props['leaked'] = True
+    code, _ = driver.execute(runner, ['feature'])
+    self.assertEqual(code, 0)
+    self.assertNotIn('leaked', props)
+    self.assertEqual(props['project_directory'], self.folder)
+    driver.shutdown()
+
+  def test_interactive_actions(self):
+    driver = create_driver(['feature'])
+    driver.prepare(self.folder)
+    self.assertTrue(driver.is_interactive(['test', 'remove', 'alpha']))
+    self.assertFalse(driver.is_interactive(['test', 'add', 'alpha']))
+    self.assertFalse(driver.is_interactive(['build']))
+    driver.shutdown()
+
+  def test_feature_on_demand(self):
+    driver = create_driver(['feature'])
+    runner = driver.prepare(self.folder)
+    ctrl = driver.renv.feature_ctrl
+
+    self.assertNotIn('feature', ctrl.get_active_features_names())
+    runner.activate_on_demand(['test', 'add', 'alpha'])
+    self.assertNotIn('feature', ctrl.get_active_features_names())
+    runner.activate_on_demand(['feature', 'update'])
+    self.assertIn('feature', ctrl.get_active_features_names())
+    driver.shutdown()
+
+  def test_untraced(self):
+    # Project logs warnings only, so lifecycle marks are not observed
+    driver = self.update()
+    self.assertFalse(driver.renv.lifecycle.observed)
+
+  def test_restores_project_templates(self):
+    cmake = os.path.join(self.folder, 'CMakeLists.txt')
+    os.remove(cmake)
+    self.update()
+    self.assertTrue(os.path.exists(cmake))
+
+  def test_keeps_edited_files(self):
+    cmake = os.path.join(self.folder, 'CMakeLists.txt')
+    with open(cmake, 'w') as handle:
+      handle.write('mine')
+    self.update()
+    with open(cmake) as handle:
+      self.assertEqual(handle.read(), 'mine')
+
+
 if __name__ == '__main__':
   unittest.main()
@@ -0,0 +1,57 @@
+from __future__ import unicode_literals
+from __future__ import print_function
+
+import subprocess
+import unittest
+import tempfile
+import shutil
+import json
+import sys
+import os
+
+ROOT = os.path.abspath(os.path.join(os.path.dirname(__file__), '..', '..'))
+
+HEAVY_MODULES = ['prompt_toolkit', 'pygments', 'prompter', 'crutch.core.repl']
+
+SCRIPT = """
+import json, sys
+sys.path.insert(0, {root!r})
+import crutch
+crutch.create_driver(sys.argv[1:]).run()
+sys.stderr.write('MODULES ' + json.dumps(sorted(sys.modules)) + '\\n')
+"""
+
+
+def run_crutch(argv, cwd):
+  """
+  Run CRUTCH in a fresh interpreter and return names of modules it imported
+  """
+  process = subprocess.Popen(
+      [sys.executable, '-c', SCRIPT.format(root=ROOT)] + argv,
+      cwd=cwd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+  _, err = process.communicate()
+  for line in err.decode('utf-8').splitlines():
+    if line.startswith('MODULES '):
+      return json.loads(line[len('MODULES '):])
+  raise AssertionError(err)
+
+
+class StartupImportsTest(unittest.TestCase):
+
+  def setUp(self):
+    self.folder = tempfile.mkdtemp()
+    run_crutch(['new', 'cpp', '--directory', self.folder], self.folder)
+
+  def tearDown(self):
+    shutil.rmtree(self.folder)
+
+  def test_build_help_skips_repl(self):
+    modules = run_crutch(['build', '--help'], self.folder)
+    self.assertIn('crutch.cpp.features.build', modules)
+    for heavy in HEAVY_MODULES:
+      self.assertEqual(
+          [m for m in modules if m == heavy or m.startswith(heavy + '.')], [])
+
+
+if __name__ == '__main__':
+  unittest.main()